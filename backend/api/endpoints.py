@@ -11,13 +11,14 @@ from models import (
     ProcessFolderRequest, ExportToSheetsRequest, FullPipelineRequest,
 )
 from services.drive_service import DriveService
-from services.ocr_service import OCRService
+from services.ocr_service import OCRService, MULTI_IMAGE_BATCH_SIZE
 from services.evaluation_service import EvaluationService
 from services.answer_key_service import AnswerKeyService
 from services.sheets_service import SheetsService
 from database import Database
 import uuid
 import os
+import asyncio
 import json
 import tempfile
 import shutil
@@ -356,22 +357,38 @@ def process_drive_folder(request: ProcessFolderRequest):
     temp_dir = tempfile.mkdtemp(prefix="sheets_")
 
     try:
+        # Download every sheet first so OCR can run concurrently
+        downloaded = []
         for idx, sheet_file in enumerate(student_sheets):
             file_name = sheet_file["name"]
-            file_id = sheet_file["id"]
-            print(f"\n{'='*50}")
-            print(f"Processing [{idx+1}/{len(student_sheets)}]: {file_name}")
-
+            print(f"Downloading [{idx+1}/{len(student_sheets)}]: {file_name}")
+            # Drive folders can hold same-named files; the id keeps each download distinct
+            local_path = os.path.join(temp_dir, f"{sheet_file['id']}_{file_name}")
             try:
-                # Download
-                local_path = os.path.join(temp_dir, file_name)
-                download_ok = drive_service.download_file(file_id, local_path)
-                if not download_ok:
+                if not drive_service.download_file(sheet_file["id"], local_path):
                     errors.append({"file": file_name, "error": "Download failed"})
                     continue
+            except Exception as e:
+                errors.append({"file": file_name, "error": str(e)})
+                print(f"  ❌ Error: {e}")
+                continue
+            downloaded.append((sheet_file, local_path))
 
-                # OCR Extract
-                extracted = ocr_service.extract_objective_sheet(local_path)
+        # OCR Extract: several sheets per request when OCR_MULTI_IMAGE_BATCH_SIZE > 1,
+        # otherwise one request per sheet (concurrent, rate-limited)
+        paths = [path for _, path in downloaded]
+        if MULTI_IMAGE_BATCH_SIZE > 1:
+            extractions = ocr_service.extract_objective_sheets_multi_image(paths, MULTI_IMAGE_BATCH_SIZE)
+        else:
+            extractions = asyncio.run(ocr_service.extract_objective_sheets_batch(paths))
+
+        for idx, ((sheet_file, local_path), extracted) in enumerate(zip(downloaded, extractions)):
+            file_name = sheet_file["name"]
+            file_id = sheet_file["id"]
+            print(f"\n{'='*50}")
+            print(f"Processing [{idx+1}/{len(downloaded)}]: {file_name}")
+
+            try:
                 if "error" in extracted:
                     errors.append({"file": file_name, "error": extracted["error"]})
                     continue
@@ -533,7 +550,7 @@ def preview_sheet(sheet_url: str):
     Does NOT write anything.
     """
     try:
-        data = sheets_service.read_student_list(sheet_url)
+        data = sheets_service.read_student_list(sheet_url, include_existing_comment=True)
         return {
             "sheet_name": data["sheet_name"],
             "columns_detected": data["columns"],
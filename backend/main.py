@@ -18,6 +18,10 @@ app.add_middleware(
 
 app.include_router(endpoints.router, prefix="/api")
 
+@app.on_event("shutdown")
+def shutdown():
+    endpoints.ocr_service.close()
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Answer Sheet Evaluation API"}
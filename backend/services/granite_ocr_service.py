@@ -1,8 +1,30 @@
-from transformers import AutoProcessor, AutoModelForVision2Seq
+from transformers import AutoProcessor, AutoModelForVision2Seq, StaticCache
 import torch
 from PIL import Image
 import os
 import time
+import base64
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+# Images are resized to a fixed canonical resolution so the number of image
+# tokens (and therefore every decode-step shape) is identical across sheets.
+# That makes the one-token decode step safe to capture as a CUDA graph.
+CANONICAL_IMAGE_SIZE = (768, 768)
+MAX_NEW_TOKENS = 1024
+GRAPH_WARMUP_STEPS = 3
+
+QUESTION = "Extract all text from this document image structure-wise. If it is a table or chart, represent it clearly."
+PROMPT = f"<|user|>\n<image>\n{QUESTION}\n<|assistant|>\n"
+
+# Optional SGLang/vLLM server for multi-user throughput (continuous batching).
+# Launch with:
+#   python -m sglang.launch_server --model-path ibm-granite/granite-vision-3.3-2b --dtype float16 --tp 1
+GRANITE_SERVER_URL = os.getenv("GRANITE_SERVER_URL", "http://localhost:30000")
+SERVER_MAX_CONCURRENCY = 8
+# Consecutive failed requests after which the server is treated as absent
+SERVER_MAX_FAILURES = 3
 
 class GraniteOCRService:
     def __init__(self):
@@ -13,6 +35,29 @@ class GraniteOCRService:
         self.processor = None
         self.model = None
         self.device = self._get_device()
+
+        # CUDA graph decode state (populated lazily on first CUDA run)
+        self._static_cache = None
+        self._static_cache_len = 0
+        self._static_ids = None
+        self._static_pos = None
+        self._static_logits = None
+        self._decode_graph = None
+        # Set after the first failed capture/replay; later sheets go straight to generate()
+        self._graph_disabled = False
+
+        # Side stream for async host-to-device copies of preprocessed inputs
+        self.copy_stream = torch.cuda.Stream() if self.device == "cuda" else None
+
+        # None = not probed yet; flips to False when the first probe fails or
+        # after SERVER_MAX_FAILURES consecutive failures
+        self.server_url = GRANITE_SERVER_URL
+        self._server_available = None if self.server_url else False
+        self._server_failures = 0
+
+        # Tokenized prompt, identical for every sheet (set in _load_model)
+        self._cached_prompt_ids = None
+        self._cached_attention_mask = None
         
     def _get_device(self):
         if torch.cuda.is_available():
@@ -37,6 +82,7 @@ class GraniteOCRService:
                 ).to(self.device)
                 
                 self.model.eval() # Set to evaluation mode
+                self._cache_prompt_tokens()
                 print(f"Granite Vision loaded in {time.time() - start_time:.2f}s")
             except Exception as e:
                 print(f"Failed to load Granite Vision: {e}")
@@ -49,6 +95,11 @@ class GraniteOCRService:
         if not os.path.exists(image_path):
             return ""
 
+        # Prefer the inference server when one is running
+        text = self._extract_via_server(image_path)
+        if text is not None:
+            return text
+
         # Load model lazily
         if self.model is None:
             self._load_model()
@@ -57,67 +108,227 @@ class GraniteOCRService:
 
         try:
             print(f"Granite Vision processing: {image_path}")
-            
-            image = Image.open(image_path).convert("RGB")
-            
-            question = "Extract all text from this document image structure-wise. If it is a table or chart, represent it clearly."
-            
-            conversation = [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "image"},
-                        {"type": "text", "text": question},
-                    ],
-                },
-            ]
-            
-            # Prepare inputs
-            inputs = self.processor.apply_chat_template(
-                conversation,
-                add_generation_prompt=True,
-                tokenize=True,
-                return_dict=True,
-                return_tensors="pt"
-            ).to(self.device)
-            
-            # Since apply_chat_template handles text, we handle image separately if needed by processor
-            # Wait, the user snippet showed apply_chat_template doing it all?
-            # User snippet:
-            # inputs = processor.apply_chat_template(...)
-            # Wait, the user snippet passed 'url' in content. We act locally.
-            # Local transformers usage usually requires passing pixel_values separately if strictly visual model
-            # But the user snippet implies apply_chat_template handles it?
-            # Let's check documentation pattern in snippet.
-            # Snippet: {"type": "image", "url": img_path}
-            # Since we have local file, we might need to pass PIL image.
-            
-            # Let's try passing the PIL image object directly in 'content' if supported,
-            # or rely on standard processor call.
-            
-            # Alternative standard usage for VLM in transformers:
-            # inputs = processor(images=image, text=prompt, return_tensors="pt").to(device)
-            
-            # User snippet uses apply_chat_template with `url`. 
-            # I will try the standard `processor(text=..., images=...)` pattern which is robust for local images.
-            
-            prompt = f"<|user|>\n<image>\n{question}\n<|assistant|>\n"
-            inputs = self.processor(text=prompt, images=image, return_tensors="pt").to(self.device)
-            
-            # Generate
-            output = self.model.generate(**inputs, max_new_tokens=1024)
-            decoded_text = self.processor.decode(output[0], skip_special_tokens=True)
-            
-            # Post-process to remove the prompt/input if echoed
-            # Usually decode returns full text. We need to extract the assistant response.
-            # But standard decode often includes prompt.
-            # Let's assume it returns everything.
-            
-            # A cleaner simple approach if chat template is complex:
-            # Just return the full string and let the next LLM clean it.
-            return decoded_text.replace(prompt, "").strip()
-
+            return self._run_inference(self._prepare_inputs(image_path))
         except Exception as e:
             print(f"Granite Vision extraction failed: {e}")
-            # Fallback to pure transformers generation if template failed
             return ""
+
+    def extract_texts(self, image_paths: List[str]) -> List[str]:
+        """
+        Extracts text from several images, overlapping CPU preprocessing (and the
+        host-to-device copy) of image N+1 with GPU inference of image N.
+        When the inference server is up, requests are sent concurrently instead.
+        """
+        texts = []
+        if image_paths and self._server_available is not False:
+            first = self.extract_text(image_paths[0])
+            if self._server_available:
+                with ThreadPoolExecutor(max_workers=SERVER_MAX_CONCURRENCY) as pool:
+                    return [first] + list(pool.map(self.extract_text, image_paths[1:]))
+            # Server turned out to be absent; the first sheet already ran locally
+            texts.append(first)
+            image_paths = image_paths[1:]
+
+        if self.model is None:
+            self._load_model()
+            if self.model is None:
+                return texts + ["" for _ in image_paths]
+
+        with ThreadPoolExecutor(max_workers=1) as prep_pool:
+            pending = prep_pool.submit(self._prepare_inputs, image_paths[0]) if image_paths else None
+            for idx, image_path in enumerate(image_paths):
+                current = pending
+                # Kick off prep for the next sheet before running this one
+                if idx + 1 < len(image_paths):
+                    pending = prep_pool.submit(self._prepare_inputs, image_paths[idx + 1])
+                try:
+                    print(f"Granite Vision processing: {image_path}")
+                    texts.append(self._run_inference(current.result()))
+                except Exception as e:
+                    print(f"Granite Vision extraction failed: {e}")
+                    texts.append("")
+        return texts
+
+    def _prepare_inputs(self, image_path: str):
+        """
+        CPU-side preprocessing. On CUDA the tensors are pinned and copied on a
+        side stream so the transfer overlaps with whatever the main stream runs.
+        """
+        image = Image.open(image_path).convert("RGB").resize(CANONICAL_IMAGE_SIZE)
+
+        # Only the image needs processing per call; the prompt ids are cached
+        if self._cached_prompt_ids is None:
+            inputs = dict(self.processor(text=PROMPT, images=image, return_tensors="pt"))
+        else:
+            inputs = dict(self.processor.image_processor(images=image, return_tensors="pt"))
+
+        if self.copy_stream is None:
+            for key, value in inputs.items():
+                if isinstance(value, torch.Tensor):
+                    inputs[key] = value.to(self.device)
+        else:
+            with torch.cuda.stream(self.copy_stream):
+                for key, value in inputs.items():
+                    if isinstance(value, torch.Tensor):
+                        inputs[key] = value.pin_memory().to(self.device, non_blocking=True)
+
+        if self._cached_prompt_ids is not None:
+            inputs["input_ids"] = self._cached_prompt_ids
+            inputs["attention_mask"] = self._cached_attention_mask
+        return inputs
+
+    def _cache_prompt_tokens(self):
+        """
+        Tokenize the prompt once. The processor expands <image> into one token per
+        image feature, which is constant because every sheet is resized to
+        CANONICAL_IMAGE_SIZE, so the expanded ids can be reused for all sheets.
+        """
+        try:
+            dummy = Image.new("RGB", CANONICAL_IMAGE_SIZE)
+            encoded = self.processor(text=PROMPT, images=dummy, return_tensors="pt")
+            self._cached_prompt_ids = encoded["input_ids"].to(self.device)
+            self._cached_attention_mask = encoded["attention_mask"].to(self.device)
+        except Exception as e:
+            print(f"Could not cache Granite prompt tokens: {e}")
+            self._cached_prompt_ids = None
+            self._cached_attention_mask = None
+
+    def _run_inference(self, inputs) -> str:
+        if self.copy_stream is not None:
+            torch.cuda.current_stream().wait_stream(self.copy_stream)
+
+        # Generate (CUDA graph replay on GPU, plain generate elsewhere)
+        output_ids = None
+        if self.device == "cuda" and not self._graph_disabled:
+            try:
+                output_ids = self._generate_cuda_graph(inputs)
+            except Exception as e:
+                print(f"CUDA graph decode failed, using generate from now on: {e}")
+                self._decode_graph = None
+                self._graph_disabled = True
+        if output_ids is None:
+            output_ids = self.model.generate(**inputs, max_new_tokens=MAX_NEW_TOKENS)[0]
+        decoded_text = self.processor.decode(output_ids, skip_special_tokens=True)
+
+        # generate() echoes the prompt; the graph path returns new tokens only.
+        # Either way, return the plain string and let the next LLM clean it.
+        return decoded_text.replace(PROMPT, "").strip()
+
+    # ──────────────────────────────────────
+    #  Inference server
+    # ──────────────────────────────────────
+
+    def _extract_via_server(self, image_path: str) -> Optional[str]:
+        """
+        POST the sheet to the SGLang /generate endpoint.
+        Returns None if the server is absent so the caller can run locally.
+        """
+        if self._server_available is False:
+            return None
+
+        with open(image_path, "rb") as image_file:
+            encoded = base64.b64encode(image_file.read()).decode('utf-8')
+
+        payload = {
+            "text": PROMPT,
+            "image_data": encoded,
+            "sampling_params": {"max_new_tokens": MAX_NEW_TOKENS, "temperature": 0},
+        }
+        try:
+            response = requests.post(f"{self.server_url}/generate", json=payload, timeout=120)
+            response.raise_for_status()
+        except requests.exceptions.ConnectionError:
+            if self._server_available is None:
+                print(f"Granite server not reachable at {self.server_url}, using local model.")
+            self._server_available = False
+            return None
+        except Exception as e:
+            # e.g. a persistent 503 while the server is still loading the model
+            self._server_failures += 1
+            if self._server_available is None or self._server_failures >= SERVER_MAX_FAILURES:
+                print(f"Granite server request failed ({e}), using local model from now on.")
+                self._server_available = False
+            else:
+                print(f"Granite server request failed: {e}")
+            return None
+
+        self._server_failures = 0
+        self._server_available = True
+        return response.json().get("text", "").strip()
+
+    # ──────────────────────────────────────
+    #  CUDA graph decode
+    # ──────────────────────────────────────
+
+    def _decode_step(self):
+        """One-token decode over the static buffers (the captured region)."""
+        return self.model(
+            input_ids=self._static_ids,
+            past_key_values=self._static_cache,
+            cache_position=self._static_pos,
+            use_cache=True,
+        ).logits
+
+    def _capture_decode_graph(self):
+        """Warm up on a side stream, then capture the decode step once."""
+        side = torch.cuda.Stream()
+        side.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(side):
+            for _ in range(GRAPH_WARMUP_STEPS):
+                self._decode_step()
+        torch.cuda.current_stream().wait_stream(side)
+
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            self._static_logits = self._decode_step()
+        self._decode_graph = graph
+
+    @torch.inference_mode()
+    def _generate_cuda_graph(self, inputs) -> torch.Tensor:
+        """
+        Greedy decode with a StaticCache, replaying a captured CUDA graph per token.
+        Returns only the newly generated token ids.
+        """
+        prompt_len = inputs["input_ids"].shape[1]
+        max_cache_len = prompt_len + MAX_NEW_TOKENS
+
+        # The graph is bound to the cache tensors, so it survives across sheets
+        # as long as the (canonical) prompt length does not change.
+        if self._static_cache is None or self._static_cache_len != max_cache_len:
+            self._static_cache = StaticCache(
+                config=self.model.config.get_text_config(),
+                max_batch_size=1,
+                max_cache_len=max_cache_len,
+                device=self.device,
+                dtype=self.model.dtype,
+            )
+            self._static_cache_len = max_cache_len
+            self._static_ids = torch.zeros((1, 1), dtype=torch.long, device=self.device)
+            self._static_pos = torch.zeros((1,), dtype=torch.long, device=self.device)
+            self._decode_graph = None
+        else:
+            self._static_cache.reset()
+
+        # Prefill (variable work, runs eagerly)
+        out = self.model(
+            **inputs,
+            past_key_values=self._static_cache,
+            cache_position=torch.arange(prompt_len, device=self.device),
+            use_cache=True,
+        )
+        next_token = out.logits[:, -1:].argmax(dim=-1)
+
+        eos_id = self.processor.tokenizer.eos_token_id
+        generated = [next_token]
+        for step in range(MAX_NEW_TOKENS - 1):
+            if next_token.item() == eos_id:
+                break
+            self._static_ids.copy_(next_token)
+            self._static_pos.fill_(prompt_len + step)
+            if self._decode_graph is None:
+                self._capture_decode_graph()
+            self._decode_graph.replay()
+            next_token = self._static_logits[:, -1:].argmax(dim=-1)
+            generated.append(next_token)
+
+        return torch.cat(generated, dim=1)[0]
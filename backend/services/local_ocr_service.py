@@ -3,15 +3,58 @@ import pytesseract
 import numpy as np
 from PIL import Image
 import os
+import threading
 import easyocr
 
 # Try importing PaddleOCR
 try:
+    import paddle
     from paddleocr import PaddleOCR
     PADDLE_AVAILABLE = True
 except ImportError:
     PADDLE_AVAILABLE = False
 
+# Mean per-box confidence EasyOCR must reach before we skip the fallbacks
+EASYOCR_MIN_CONFIDENCE = 0.5
+
+# Serialized TensorRT engines; without this they are rebuilt on every start
+PADDLE_TRT_CACHE_DIR = os.path.expanduser(os.getenv("PADDLE_TRT_CACHE_DIR", "~/.cache/paddle_trt"))
+
+# Serializes PaddleOCR construction: the paddle.inference.Config swap below is
+# process-wide, so two concurrent inits could otherwise leave it installed
+_PADDLE_INIT_LOCK = threading.Lock()
+
+
+def _tensorrt_available() -> bool:
+    """
+    True only for a CUDA build of Paddle compiled against TensorRT with a GPU
+    visible. PaddleOCR silently drops use_gpu/use_tensorrt otherwise.
+    """
+    try:
+        return (
+            paddle.is_compiled_with_cuda()
+            and paddle.device.cuda.device_count() > 0
+            and tuple(paddle.inference.get_trt_compile_version()) != (0, 0, 0)
+        )
+    except Exception:
+        return False
+
+
+def _engine_caching_config(base):
+    """
+    paddle.inference.Config that serializes TensorRT engines into
+    PADDLE_TRT_CACHE_DIR (PaddleOCR passes use_static=False and exposes no
+    cache dir option).
+    """
+    class Config(base):
+        def enable_tensorrt_engine(self, *args, **kwargs):
+            kwargs["use_static"] = True
+            super().enable_tensorrt_engine(*args, **kwargs)
+            self.set_optim_cache_dir(PADDLE_TRT_CACHE_DIR)
+
+    return Config
+
+
 class LocalOCRService:
     def __init__(self):
         """
@@ -30,14 +73,41 @@ class LocalOCRService:
 
     def _get_paddle_ocr(self):
         if self.paddle_ocr is None and PADDLE_AVAILABLE:
-            print("Initializing PaddleOCR...")
-            self.paddle_ocr = PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+            with _PADDLE_INIT_LOCK:
+                # Another request may have finished initializing while we waited
+                if self.paddle_ocr is None:
+                    self.paddle_ocr = self._create_paddle_ocr()
         return self.paddle_ocr
 
+    @staticmethod
+    def _create_paddle_ocr():
+        """Build PaddleOCR; call with _PADDLE_INIT_LOCK held."""
+        print("Initializing PaddleOCR...")
+        # TensorRT FP16 engine (CUDA + TensorRT builds only); default backend otherwise
+        if _tensorrt_available():
+            os.makedirs(PADDLE_TRT_CACHE_DIR, exist_ok=True)
+            base_config = paddle.inference.Config
+            paddle.inference.Config = _engine_caching_config(base_config)
+            try:
+                ocr = PaddleOCR(
+                    use_angle_cls=True, lang='en', show_log=False,
+                    use_gpu=True, use_tensorrt=True, precision='fp16'
+                )
+                print(f"✅ PaddleOCR using TensorRT (fp16), engines cached in {PADDLE_TRT_CACHE_DIR}.")
+                return ocr
+            except Exception as e:
+                print(f"PaddleOCR TensorRT init failed ({e}), using default backend.")
+            finally:
+                paddle.inference.Config = base_config
+        else:
+            print("PaddleOCR: no CUDA/TensorRT build or GPU, using default backend.")
+        return PaddleOCR(use_angle_cls=True, lang='en', show_log=False)
+
     def extract_text(self, image_path: str) -> str:
         """
         Extracts raw text from an image using available local OCR engines.
         Priority: EasyOCR -> PaddleOCR -> Tesseract
+        Fallbacks only run when EasyOCR's mean box confidence is low.
         """
         if not os.path.exists(image_path):
             return ""
@@ -47,11 +117,14 @@ class LocalOCRService:
         # 1. Try EasyOCR (Primary)
         try:
             reader = self._get_easyocr_reader()
-            results = reader.readtext(image_path, detail=0)
-            text = " ".join(results)
-            if len(text.strip()) > 10:
-                print("✅ EasyOCR successful.")
+            # detail=1 -> [(box, text, confidence), ...]
+            results = reader.readtext(image_path, detail=1)
+            text = " ".join(r[1] for r in results)
+            mean_conf = float(np.mean([r[2] for r in results])) if results else 0.0
+            if mean_conf >= EASYOCR_MIN_CONFIDENCE and len(text.strip()) > 10:
+                print(f"✅ EasyOCR successful (conf {mean_conf:.2f}).")
                 return text.strip()
+            print(f"EasyOCR low confidence ({mean_conf:.2f}), trying fallbacks...")
         except Exception as e:
             print(f"EasyOCR failed: {e}")
 
@@ -1,13 +1,134 @@
 import os
+import re
+import time
+import asyncio
+import threading
+from datetime import datetime, timedelta, timezone
 import requests
+from requests.adapters import HTTPAdapter
+import httpx
 import base64
+import hashlib
+import io
+import mmap
 import json
-import re
+import orjson
+import ijson
+import diskcache
+import uuid
+from typing import List, Optional, Tuple
 from google.oauth2 import service_account
+from google.cloud import storage
+from PIL import Image, ImageOps
 import google.auth.transport.requests
 import google.auth
 
+# Defaults for concurrent batch extraction
+MAX_CONCURRENCY = 8
+REQUESTS_PER_SECOND = 4.0
+
+# Sheets per Gemini call in extract_objective_sheets_multi_image; 0 or 1 keeps
+# the one-sheet-per-request path
+MULTI_IMAGE_BATCH_SIZE = int(os.getenv("OCR_MULTI_IMAGE_BATCH_SIZE", "0"))
+
+# An item from a multi-image response is only trusted (and cached) when its
+# entry number looks like yyyyBBBnnnn
+_ENTRY_NUMBER_RE = re.compile(r'[0-9]{4}\s*[A-Za-z]{2,4}\s*[0-9]{2,5}')
+
+# Refresh the OAuth token this long before it actually expires
+TOKEN_REFRESH_MARGIN = timedelta(seconds=60)
+
+# Retry policy for transient Vertex AI failures (quota spikes, 5xx)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Objective OCR result cache. Bump PROMPT_VERSION whenever the objective
+# prompt changes so stale extractions are not served.
+PROMPT_VERSION = 1
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "./.ocr_cache")
+OCR_CACHE_TTL = 30 * 86400  # 30 days
+
+# Optional scratch bucket: when set, sheets are uploaded and referenced by
+# gs:// URI instead of being base64-inlined into the request body.
+OCR_TEMP_BUCKET = os.getenv("OCR_TEMP_BUCKET")
+
+# Gemini gains nothing from very large photos; downscale before upload
+MAX_IMAGE_SIDE = 1600
+JPEG_QUALITY = 85
+
+# Gemini rejects inline request bodies over ~20 MB; fail before uploading
+MAX_INLINE_BYTES = 19 * 1024 * 1024
+
+
+class RateLimiter:
+    """Enforces a minimum interval between request starts (async)."""
+
+    def __init__(self, requests_per_second: float):
+        self.min_interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.last_call_ts = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            await asyncio.sleep(max(0.0, self.min_interval - (now - self.last_call_ts)))
+            self.last_call_ts = time.monotonic()
+
+
 class OCRService:
+    # Prompts are class constants so they are built once, not per request
+    _PROMPT = """
+        Analyze this answer sheet image. 
+        Extract the following fields and return ONLY a valid JSON object. Do not format as markdown.
+        
+        Fields to extract:
+        1. "student_name": The name of the student if written.
+        2. "roll_number": The roll number/ID.
+        3. "exam_code": Any exam code or subject code if visible.
+        4. "objective_answers": A list of objects for MCQ/One-word answers, containing:
+           - "question_number": (integer)
+           - "marked_option": (string, e.g., "A", "B", "C", "D" or the handwritten text)
+        5. "subjective_answers": A list of objects for descriptive answers, containing:
+           - "question_number": (integer)
+           - "answer_text": (string, the full handwritten text of the answer)
+        
+        If a specific field is not found, set it to null or empty list.
+        Ensure the JSON is valid and properly formatted.
+        """
+
+    _OBJECTIVE_PROMPT = """
+You are an expert OCR for handwritten answer sheets. Your goal is to extract the student's ID, Name, and their Answers.
+
+IMAGE CONTEXT:
+- The image contains handwritten answers like "1(a)", "2-C", "3. b", or just "1. A".
+- The Entry Number/Roll Number is a code like `2023CSB1122`.
+
+TASK:
+1. **Entry Number**: Find the alphanumeric ID (e.g., 2023CSB1122). Normalize it: uppercase, no spaces.
+2. **Name**: Find the student name.
+3. **Answers**: Look for numbered lists (1, 2, 3...) and the option written next to them. 
+   - The option might be in brackets `(a)`, circled, or just written.
+   - Convert ALL options to single uppercase letters: A, B, C, D.
+   - If you see "1 (a)", extract `{"1": "A"}`.
+   - If you see "2. c", extract `{"2": "C"}`.
+
+OUTPUT FORMAT (JSON ONLY):
+{
+    "entry_number": "2023CSB1122",
+    "name": "Student Name",
+    "answers": {
+        "1": "A",
+        "2": "C",
+        "3": "B"
+    },
+    "comments": "Any issues (e.g. unclear text)"
+}
+
+If no answers are found, return "answers": {}.
+"""
+
     def __init__(self, api_key: str = None, provider: str = None):
         """
         Initialize OCR service using Service Account or API Key.
@@ -16,6 +137,18 @@ class OCRService:
         self.location = "us-central1"
         self.model_id = "gemini-2.5-flash-lite"
         self.creds = None
+
+        # Pooled keep-alive session: reuses TCP + TLS across OCR calls.
+        # Retries are handled by _post_with_retry, not by the adapter.
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=0))
+
+        # Prompt parts reused by reference in every request payload
+        self._prompt_part = {"text": self._PROMPT}
+        self._objective_prompt_part = {"text": self._OBJECTIVE_PROMPT}
+
+        # Content-addressed cache of parsed objective extractions
+        self.cache = diskcache.Cache(OCR_CACHE_DIR)
         
         # Try finding Service Account credentials
         creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
@@ -32,6 +165,22 @@ class OCRService:
             except Exception as e:
                 print(f"⚠️ Failed to load Service Account: {e}")
 
+        # Temp GCS bucket for file_data uploads (Service Account only)
+        self.bucket = None
+        if self.creds and OCR_TEMP_BUCKET:
+            try:
+                self.gcs = storage.Client(project=self.project_id, credentials=self.creds)
+                self.bucket = self.gcs.bucket(OCR_TEMP_BUCKET)
+                print(f"✅ OCR uploads via gs://{OCR_TEMP_BUCKET}")
+            except Exception as e:
+                print(f"⚠️ GCS unavailable, falling back to inline images: {e}")
+
+        # Cached bearer header; pre-warmed off the startup path
+        self._token_lock = threading.Lock()
+        self._cached_header = None
+        if self.creds:
+            threading.Thread(target=self._get_auth_header, daemon=True).start()
+
         # Fallback to API Key (Legacy)
         self.vertex_api_key = api_key or os.getenv("VERTEX_AI_API_KEY")
         
@@ -51,22 +200,99 @@ class OCRService:
             print("⚠️ OCR Service Warning: No valid credentials (API Key or Service Account) found.")
             # Don't raise error immediately, allow 'extract' to fail or use fallback if implemented
 
+    def close(self):
+        """Release pooled HTTP connections and the result cache."""
+        self.session.close()
+        self.cache.close()
+
     def _get_auth_header(self):
-        """Get Authorization header with Bearer token if using Service Account."""
+        """
+        Get Authorization header with Bearer token if using Service Account.
+        The header is cached and handed out lock-free until the token is within
+        TOKEN_REFRESH_MARGIN of expiry; only then is the lock taken to refresh.
+        """
         if self.creds:
-            try:
-                auth_req = google.auth.transport.requests.Request()
-                self.creds.refresh(auth_req)
-                return {"Authorization": f"Bearer {self.creds.token}", "Content-Type": "application/json"}
-            except Exception as e:
-                print(f"❌ Failed to refresh token: {e}")
-                return {"Content-Type": "application/json"} 
+            header = self._cached_header
+            if header is not None and not self._token_expiring():
+                return header
+
+            with self._token_lock:
+                # Another thread may have refreshed while we waited
+                if self._cached_header is None or self._token_expiring():
+                    try:
+                        auth_req = google.auth.transport.requests.Request()
+                        self.creds.refresh(auth_req)
+                        self._cached_header = {"Authorization": f"Bearer {self.creds.token}", "Content-Type": "application/json"}
+                    except Exception as e:
+                        print(f"❌ Failed to refresh token: {e}")
+                        return {"Content-Type": "application/json"} 
+                return self._cached_header
         return {"Content-Type": "application/json"}
 
-    def _encode_image(self, image_path: str) -> str:
-        """Encode image to base64"""
+    async def _get_auth_header_async(self):
+        """
+        _get_auth_header for coroutines: the cached header is a plain read;
+        only an actual (blocking) token refresh is pushed to a worker thread.
+        """
+        if self.creds and (self._cached_header is None or self._token_expiring()):
+            return await asyncio.get_running_loop().run_in_executor(None, self._get_auth_header)
+        return self._get_auth_header()
+
+    def _token_expiring(self) -> bool:
+        expiry = self.creds.expiry  # naive UTC, as google-auth stores it
+        if expiry is None:
+            return True
+        return expiry - datetime.now(timezone.utc).replace(tzinfo=None) < TOKEN_REFRESH_MARGIN
+
+    def _downscaled_jpeg(self, image_path: str) -> Optional[bytes]:
+        """
+        JPEG bytes of the image shrunk to fit MAX_IMAGE_SIDE, or None when the
+        file is already small enough or is not a raster image (e.g. PDF).
+        """
+        if self._get_mime_type(image_path) == "application/pdf":
+            return None
+        try:
+            with Image.open(image_path) as img:
+                if max(img.size) <= MAX_IMAGE_SIDE:
+                    return None
+                # Re-encoding drops EXIF; bake the orientation into the pixels
+                img = ImageOps.exif_transpose(img).convert("RGB")  # JPEG has no alpha channel
+                img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+                buf = io.BytesIO()
+                img.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+                return buf.getvalue()
+        except OSError:
+            return None
+
+    def _reject_image(self, image_path: str) -> Optional[str]:
+        """
+        Cheap pre-flight check: an error message for corrupt images or files
+        too large to inline, None when the sheet is fine to send.
+        """
+        if self._get_mime_type(image_path) != "application/pdf":
+            try:
+                with Image.open(image_path) as img:
+                    needs_downscale = max(img.size) > MAX_IMAGE_SIDE
+                    img.verify()
+            except Exception:
+                return f"Invalid image: {image_path}"
+            if needs_downscale:
+                return None  # re-encoded well under the limit
+        if self.bucket is None and os.stat(image_path).st_size > MAX_INLINE_BYTES:
+            return f"Image too large to inline: {image_path}"
+        return None
+
+    def _encode_image(self, image_path: str) -> Tuple[str, str]:
+        """Encode image to base64 (downscaled if large). Returns (data, mime_type)."""
+        resized = self._downscaled_jpeg(image_path)
+        if resized is not None:
+            return base64.b64encode(resized).decode('ascii'), "image/jpeg"
+        # Encode straight from a read-only mapping: no intermediate bytes copy
         with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
+            if os.fstat(image_file.fileno()).st_size == 0:
+                return "", self._get_mime_type(image_path)
+            with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return base64.b64encode(mm).decode('ascii'), self._get_mime_type(image_path)
 
     def extract_data(self, image_path: str):
         # ... (rest is same, but updated below calls) ...
@@ -81,12 +307,7 @@ class OCRService:
         
         try:
             # Encode image
-            base64_image = self._encode_image(image_path)
-            
-            # Determine mime type
-            mime_type = "image/png"
-            if image_path.lower().endswith(('.jpg', '.jpeg')):
-                mime_type = "image/jpeg"
+            base64_image, mime_type = self._encode_image(image_path)
             
             # Prepare request
             payload = {
@@ -94,9 +315,7 @@ class OCRService:
                     {
                         "role": "user",
                         "parts": [
-                            {
-                                "text": self._get_prompt()
-                            },
+                            self._prompt_part,
                             {
                                 "inline_data": {
                                     "mime_type": mime_type,
@@ -111,12 +330,10 @@ class OCRService:
             headers = self._get_auth_header()
             
             # Make request
-            response = requests.post(self.vertex_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
+            response = self._post_with_retry(self.vertex_url, headers, payload, stream=True)
             
             # Parse streaming response
-            result = response.json()
-            extracted_text = self._parse_streaming_response(result)
+            extracted_text = self._stream_response_text(response)
             
             # Parse JSON from extracted text
             return self._parse_json(extracted_text)
@@ -125,64 +342,124 @@ class OCRService:
             print(f"Vertex AI extraction failed: {e}")
             return {"error": str(e)}
 
+    # ──────────────────────────────────────
+    #  HTTP with retry
+    # ──────────────────────────────────────
+
+    @staticmethod
+    def _retry_delay(attempt: int, retry_after: str = None) -> float:
+        """Exponential backoff, honoring a numeric Retry-After header if present."""
+        if retry_after:
+            try:
+                return min(RETRY_MAX_DELAY, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+
+    def _post_with_retry(self, url: str, headers: dict, payload: dict, timeout: int = 30, stream: bool = False):
+        """
+        POST with retries on 429/5xx and connection errors.
+        Other 4xx responses fail immediately via raise_for_status().
+        With stream=True the body is left unread for _stream_response_text().
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            last_attempt = attempt == MAX_ATTEMPTS - 1
+            try:
+                response = self.session.post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+            except requests.exceptions.RequestException as e:
+                if last_attempt:
+                    raise
+                delay = self._retry_delay(attempt)
+                print(f"⚠️ Request error ({e}), retrying in {delay:.1f}s...")
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                response.raise_for_status()
+                return response
+
+            response.close()
+            delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+            print(f"⚠️ Vertex AI returned {response.status_code}, retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+    async def _post_with_retry_async(self, client: "httpx.AsyncClient", url: str, headers: dict, payload: dict):
+        """Async counterpart of _post_with_retry."""
+        for attempt in range(MAX_ATTEMPTS):
+            last_attempt = attempt == MAX_ATTEMPTS - 1
+            try:
+                response = await client.post(url, headers=headers, json=payload)
+            except httpx.RequestError as e:
+                if last_attempt:
+                    raise
+                delay = self._retry_delay(attempt)
+                print(f"⚠️ Request error ({e}), retrying in {delay:.1f}s...")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                response.raise_for_status()
+                return response
+
+            delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+            print(f"⚠️ Vertex AI returned {response.status_code}, retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
     def _parse_streaming_response(self, result):
         """Parse streaming response from Vertex AI"""
-        all_text = []
-        
-        # Handle both single object and array of objects
-        if isinstance(result, list):
-            # Streaming response - array of chunks
-            for chunk in result:
-                if "candidates" in chunk:
-                    for candidate in chunk["candidates"]:
-                        if "content" in candidate and "parts" in candidate["content"]:
-                            for part in candidate["content"]["parts"]:
-                                if "text" in part:
-                                    all_text.append(part["text"])
-        elif isinstance(result, dict):
-            # Single response object
-            if "candidates" in result:
-                for candidate in result["candidates"]:
-                    if "content" in candidate and "parts" in candidate["content"]:
-                        for part in candidate["content"]["parts"]:
-                            if "text" in part:
-                                all_text.append(part["text"])
-        
-        return "".join(all_text)
+        # Handle both single object and array of objects (streaming chunks)
+        chunks = result if isinstance(result, list) else [result] if isinstance(result, dict) else ()
+        return "".join(
+            part["text"]
+            for chunk in chunks
+            for candidate in chunk.get("candidates", ())
+            for part in candidate.get("content", {}).get("parts", ())
+            if "text" in part
+        )
+
+    def _stream_response_text(self, response) -> str:
+        """
+        Same result as _parse_streaming_response(response.json()), but pulls the
+        text parts straight off the socket with ijson instead of building the
+        whole chunk list in memory first.
+        """
+        out = io.StringIO()
+        try:
+            response.raw.decode_content = True
+            for prefix, event, value in ijson.parse(response.raw):
+                if event == "string" and prefix.endswith("candidates.item.content.parts.item.text"):
+                    out.write(value)
+        finally:
+            response.close()
+        return out.getvalue()
 
     def _get_prompt(self):
-        return """
-        Analyze this answer sheet image. 
-        Extract the following fields and return ONLY a valid JSON object. Do not format as markdown.
-        
-        Fields to extract:
-        1. "student_name": The name of the student if written.
-        2. "roll_number": The roll number/ID.
-        3. "exam_code": Any exam code or subject code if visible.
-        4. "objective_answers": A list of objects for MCQ/One-word answers, containing:
-           - "question_number": (integer)
-           - "marked_option": (string, e.g., "A", "B", "C", "D" or the handwritten text)
-        5. "subjective_answers": A list of objects for descriptive answers, containing:
-           - "question_number": (integer)
-           - "answer_text": (string, the full handwritten text of the answer)
-        
-        If a specific field is not found, set it to null or empty list.
-        Ensure the JSON is valid and properly formatted.
-        """
+        return self._PROMPT
+
+    @staticmethod
+    def _strip_code_fence(text: str) -> str:
+        return text.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+
+    @staticmethod
+    def _loads(text: str):
+        """orjson first; stdlib json once as a fallback (it accepts NaN etc.)."""
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            return json.loads(text)
 
     def _parse_json(self, text):
         """Parse JSON from text, handling markdown code blocks"""
-        # Remove markdown code blocks
-        cleaned_text = re.sub(r'```json\s*|\s*```', '', text).strip()
+        cleaned_text = self._strip_code_fence(text)
         
         try:
-            return json.loads(cleaned_text)
+            return self._loads(cleaned_text)
         except json.JSONDecodeError:
             # Try to find JSON object in text
-            match = re.search(r'\{.*\}', cleaned_text, re.DOTALL)
-            if match:
+            start, end = cleaned_text.find("{"), cleaned_text.rfind("}")
+            if start != -1 and end > start:
                 try:
-                    return json.loads(match.group())
+                    return self._loads(cleaned_text[start:end + 1])
                 except json.JSONDecodeError:
                     pass
             
@@ -212,89 +489,316 @@ class OCRService:
 
         print(f"📝 Processing objective sheet: {image_path}")
 
+        rejection = self._reject_image(image_path)
+        if rejection:
+            return {"error": rejection}
+
         try:
-            base64_image = self._encode_image(image_path)
+            cache_key = self._cache_key(image_path)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"♻️  OCR cache hit: {image_path}")
+                return cached
+
+            image_part, blob = self._make_image_part(image_path)
+            try:
+                payload = self._build_objective_payload(image_part)
+                headers = self._get_auth_header()
+                response = self._post_with_retry(self.vertex_url, headers, payload, stream=True)
+                extracted_text = self._stream_response_text(response)
+            finally:
+                self._delete_blob(blob)
+
+            return self._store_in_cache(cache_key, self._handle_objective_text(extracted_text))
+
+        except Exception as e:
+            print(f"❌ Objective sheet extraction failed: {e}")
+            return {"error": str(e)}
+
+    def _cache_key(self, image_path: str) -> str:
+        """sha256 of the image bytes + model + prompt version."""
+        digest = hashlib.sha256()
+        with open(image_path, "rb") as image_file:
+            for block in iter(lambda: image_file.read(1 << 20), b""):
+                digest.update(block)
+        return f"{digest.hexdigest()}:{self.model_id}:v{PROMPT_VERSION}"
+
+    def _store_in_cache(self, cache_key: str, result: dict) -> dict:
+        """Cache successful extractions only, so failures are retried next run."""
+        if "error" not in result:
+            self.cache.set(cache_key, result, expire=OCR_CACHE_TTL)
+        return result
 
-            mime_type = "image/png"
-            if image_path.lower().endswith(('.jpg', '.jpeg')):
+    @staticmethod
+    def _get_mime_type(image_path: str) -> str:
+        mime_type = "image/png"
+        if image_path.lower().endswith(('.jpg', '.jpeg')):
+            mime_type = "image/jpeg"
+        elif image_path.lower().endswith('.pdf'):
+            mime_type = "application/pdf"
+        return mime_type
+
+    def _make_image_part(self, image_path: str) -> Tuple[dict, Optional["storage.Blob"]]:
+        """
+        Build the image part of a Gemini request.
+        Uses a gs:// reference when a temp bucket is configured (caller deletes
+        the returned blob), otherwise inlines the image as base64.
+        """
+        if self.bucket is not None:
+            mime_type = self._get_mime_type(image_path)
+            blob = self.bucket.blob(f"ocr-tmp/{uuid.uuid4().hex}{os.path.splitext(image_path)[1]}")
+            resized = self._downscaled_jpeg(image_path)
+            if resized is not None:
                 mime_type = "image/jpeg"
-            elif image_path.lower().endswith('.pdf'):
-                mime_type = "application/pdf"
+                blob.upload_from_string(resized, content_type=mime_type)
+            else:
+                blob.upload_from_filename(image_path, content_type=mime_type)
+            part = {
+                "file_data": {
+                    "mime_type": mime_type,
+                    "file_uri": f"gs://{self.bucket.name}/{blob.name}"
+                }
+            }
+            return part, blob
 
-            payload = {
-                "contents": [
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": self._get_objective_prompt()},
-                            {
-                                "inline_data": {
-                                    "mime_type": mime_type,
-                                    "data": base64_image
-                                }
-                            }
-                        ]
-                    }
-                ]
+        data, mime_type = self._encode_image(image_path)
+        part = {
+            "inline_data": {
+                "mime_type": mime_type,
+                "data": data
             }
+        }
+        return part, None
 
-            headers = self._get_auth_header()
-            response = requests.post(
-                self.vertex_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-
-            result = response.json()
-            extracted_text = self._parse_streaming_response(result)
-            print(f"DEBUG RAW OCR: {extracted_text}")
-            parsed = self._parse_json(extracted_text)
-            print(f"DEBUG PARSED: {parsed}")
-
-            if "error" in parsed:
-                return parsed
-
-            # Normalize the output
-            return self._normalize_objective_output(parsed)
+    @staticmethod
+    def _delete_blob(blob):
+        if blob is None:
+            return
+        try:
+            blob.delete()
+        except Exception as e:
+            print(f"⚠️ Failed to delete temp upload {blob.name}: {e}")
+
+    def _build_objective_payload(self, image_part: dict) -> dict:
+        return {
+            "contents": [
+                {
+                    "role": "user",
+                    "parts": [
+                        self._objective_prompt_part,
+                        image_part
+                    ]
+                }
+            ]
+        }
+
+    def _handle_objective_text(self, extracted_text: str) -> dict:
+        print(f"DEBUG RAW OCR: {extracted_text}")
+        parsed = self._parse_json(extracted_text)
+        print(f"DEBUG PARSED: {parsed}")
+
+        if "error" in parsed:
+            return parsed
+
+        # Normalize the output
+        return self._normalize_objective_output(parsed)
+
+    # ──────────────────────────────────────
+    #  Concurrent (async) Objective Extraction
+    # ──────────────────────────────────────
+
+    async def extract_objective_sheets_batch(
+        self,
+        image_paths: List[str],
+        max_concurrency: int = MAX_CONCURRENCY,
+        requests_per_second: float = REQUESTS_PER_SECOND,
+    ) -> List[dict]:
+        """
+        Run extract_objective_sheet over many sheets concurrently.
+        At most `max_concurrency` requests are in flight and request starts are
+        spaced by the rate limiter to stay inside the Vertex AI quota.
+        Results are returned in the same order as `image_paths`.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        limiter = RateLimiter(requests_per_second)
+
+        # One pooled HTTP/2 client per batch (clients are bound to their event loop)
+        async with httpx.AsyncClient(http2=True, timeout=30) as client:
+            return await asyncio.gather(*[
+                self.extract_objective_sheet_async(p, client, semaphore, limiter)
+                for p in image_paths
+            ])
+
+    async def extract_objective_sheet_async(
+        self,
+        image_path: str,
+        client: "httpx.AsyncClient",
+        semaphore: asyncio.Semaphore,
+        limiter: "RateLimiter",
+    ) -> dict:
+        """Async counterpart of extract_objective_sheet (same return shape)."""
+        if not os.path.exists(image_path):
+            return {"error": f"File not found: {image_path}"}
+
+        rejection = self._reject_image(image_path)
+        if rejection:
+            return {"error": rejection}
+
+        try:
+            # Hashing and base64 encoding are CPU work; keep them off the event loop
+            loop = asyncio.get_running_loop()
+            cache_key = await loop.run_in_executor(None, self._cache_key, image_path)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"♻️  OCR cache hit: {image_path}")
+                return cached
+
+            image_part, blob = await loop.run_in_executor(None, self._make_image_part, image_path)
+            try:
+                payload = self._build_objective_payload(image_part)
+                async with semaphore:
+                    await limiter.wait()
+                    print(f"📝 Processing objective sheet: {image_path}")
+                    headers = await self._get_auth_header_async()
+                    response = await self._post_with_retry_async(client, self.vertex_url, headers, payload)
+            finally:
+                await loop.run_in_executor(None, self._delete_blob, blob)
+
+            return self._store_in_cache(cache_key, self._handle_objective_text(self._parse_streaming_response(response.json())))
 
         except Exception as e:
             print(f"❌ Objective sheet extraction failed: {e}")
             return {"error": str(e)}
 
-    def _get_objective_prompt(self):
-        return """
-You are an expert OCR for handwritten answer sheets. Your goal is to extract the student's ID, Name, and their Answers.
+    # ──────────────────────────────────────
+    #  Multi-sheet (batched) Objective Extraction
+    # ──────────────────────────────────────
 
-IMAGE CONTEXT:
-- The image contains handwritten answers like "1(a)", "2-C", "3. b", or just "1. A".
-- The Entry Number/Roll Number is a code like `2023CSB1122`.
+    def extract_objective_sheets_multi_image(self, image_paths: List[str], batch_size: int = 4) -> List[dict]:
+        """
+        Extract several objective sheets per Gemini call, amortizing auth, TLS,
+        prompt tokens and stream framing over `batch_size` images.
+        The model returns a JSON array aligned with the image order; any sheet
+        whose item is missing, errored or has no parseable entry number is
+        retried on its own. Results are returned in the same order as `image_paths`.
+        """
+        results: List[Optional[dict]] = [None] * len(image_paths)
+        pending = []  # (index, cache_key)
+
+        for idx, image_path in enumerate(image_paths):
+            if not os.path.exists(image_path):
+                results[idx] = {"error": f"File not found: {image_path}"}
+                continue
+            rejection = self._reject_image(image_path)
+            if rejection:
+                results[idx] = {"error": rejection}
+                continue
+            cache_key = self._cache_key(image_path)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                print(f"♻️  OCR cache hit: {image_path}")
+                results[idx] = cached
+            else:
+                pending.append((idx, cache_key))
+
+        for start in range(0, len(pending), batch_size):
+            group = pending[start:start + batch_size]
+            print(f"📝 Processing {len(group)} objective sheets in one request")
+            try:
+                parsed_items = self._extract_objective_group([image_paths[i] for i, _ in group])
+            except Exception as e:
+                print(f"❌ Batched extraction failed, retrying sheets individually: {e}")
+                parsed_items = []
 
-TASK:
-1. **Entry Number**: Find the alphanumeric ID (e.g., 2023CSB1122). Normalize it: uppercase, no spaces.
-2. **Name**: Find the student name.
-3. **Answers**: Look for numbered lists (1, 2, 3...) and the option written next to them. 
-   - The option might be in brackets `(a)`, circled, or just written.
-   - Convert ALL options to single uppercase letters: A, B, C, D.
-   - If you see "1 (a)", extract `{"1": "A"}`.
-   - If you see "2. c", extract `{"2": "C"}`.
+            trusted = self._trusted_group_items(parsed_items, len(group))
+            for (idx, cache_key), normalized in zip(group, trusted):
+                if normalized is not None:
+                    results[idx] = self._store_in_cache(cache_key, normalized)
+                else:
+                    # Singleton fallback (caches its own result)
+                    results[idx] = self.extract_objective_sheet(image_paths[idx])
 
-OUTPUT FORMAT (JSON ONLY):
-{
-    "entry_number": "2023CSB1122",
-    "name": "Student Name",
-    "answers": {
-        "1": "A",
-        "2": "C",
-        "3": "B"
-    },
-    "comments": "Any issues (e.g. unclear text)"
-}
+        return results
 
-If no answers are found, return "answers": {}.
+    def _trusted_group_items(self, parsed_items: list, count: int) -> List[Optional[dict]]:
+        """
+        Normalized item per image, or None where the sheet must be re-extracted
+        on its own. Alignment is only trusted when the array has exactly one
+        item per image and no two items share an entry number; otherwise every
+        sheet in the group is re-extracted (a dropped image shifts the rest).
+        """
+        if len(parsed_items) != count:
+            if parsed_items:
+                print(f"⚠️ Batched response has {len(parsed_items)} items for {count} sheets; re-extracting each")
+            return [None] * count
+
+        trusted = []
+        for item in parsed_items:
+            try:
+                normalized = (
+                    self._normalize_objective_output(item)
+                    if isinstance(item, dict) and "error" not in item else None
+                )
+            except Exception as e:
+                # e.g. a non-integer question number; retry that sheet on its own
+                print(f"⚠️ Could not normalize batched item ({e}); re-extracting that sheet")
+                normalized = None
+            if normalized and not _ENTRY_NUMBER_RE.search(str(normalized["entry_number"])):
+                normalized = None
+            trusted.append(normalized)
+
+        entries = [re.sub(r'\s', '', str(n["entry_number"])).upper() for n in trusted if n]
+        if len(entries) != len(set(entries)):
+            print("⚠️ Batched response repeats an entry number; re-extracting each sheet")
+            return [None] * count
+        return trusted
+
+    def _extract_objective_group(self, image_paths: List[str]) -> list:
+        """One request for several sheets; returns the raw parsed JSON array."""
+        blobs = []
+        try:
+            parts = [{"text": self._get_batch_objective_prompt(len(image_paths))}]
+            for image_path in image_paths:
+                image_part, blob = self._make_image_part(image_path)
+                parts.append(image_part)
+                blobs.append(blob)
+
+            payload = {"contents": [{"role": "user", "parts": parts}]}
+            headers = self._get_auth_header()
+            response = self._post_with_retry(self.vertex_url, headers, payload, stream=True)
+            extracted_text = self._stream_response_text(response)
+        finally:
+            for blob in blobs:
+                self._delete_blob(blob)
+
+        return self._parse_json_array(extracted_text)
+
+    def _get_batch_objective_prompt(self, count: int) -> str:
+        return self._get_objective_prompt() + f"""
+BATCH MODE:
+You are given {count} answer sheet images, one per student.
+Return a JSON array of length {count}. Element i must be the JSON object
+(in the format above) for image i, in the same order as the images.
 """
 
+    def _parse_json_array(self, text) -> list:
+        """Parse a JSON array from model text, handling markdown code blocks."""
+        cleaned_text = self._strip_code_fence(text)
+        try:
+            parsed = self._loads(cleaned_text)
+        except json.JSONDecodeError:
+            start, end = cleaned_text.find("["), cleaned_text.rfind("]")
+            if start == -1 or end <= start:
+                return []
+            try:
+                parsed = self._loads(cleaned_text[start:end + 1])
+            except json.JSONDecodeError:
+                return []
+        return parsed if isinstance(parsed, list) else []
+
+    def _get_objective_prompt(self):
+        return self._OBJECTIVE_PROMPT
+
     def _normalize_objective_output(self, parsed: dict) -> dict:
         """Normalize OCR output to the expected format for match_and_score()."""
         result = {
@@ -10,10 +10,146 @@ Supports writing per-question marks if columns like '1', 'Q1', '2', 'Q2' are pre
 
 import os
 import re
+import logging
+import time
+import asyncio
+import functools
+import threading
+from collections import Counter
+import httpx
+import pandas as pd
+import google.auth.transport.requests
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from typing import List, Dict, Optional, Tuple, Any
 
+# Try importing rapidfuzz (C++ fuzzy matching); trigram Jaccard otherwise
+try:
+    from rapidfuzz import fuzz, process
+    from rapidfuzz.distance import Levenshtein
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SHEETS_API_URL = "https://sheets.googleapis.com/v4/spreadsheets"
+
+# Precompiled patterns for per-row / per-URL hot paths
+_SHEET_ID_RE = re.compile(r'/spreadsheets/d/([a-zA-Z0-9-_]+)')
+_GID_RE = re.compile(r'[#&?]gid=(\d+)')
+
+# Fallback cleanup for entry numbers: drop whitespace and - _ . / separators.
+# str.translate does this in one C pass; the whitespace set is exactly what
+# regex \s matches (str.isspace), all of which lies below U+3001
+_STRIP_TABLE = str.maketrans('', '', '-_./' + ''.join(c for c in map(chr, range(0x3001)) if c.isspace()))
+
+# Placeholder entry numbers the OCR emits when it can't read one
+_UNKNOWN_TOKENS = frozenset({'unknown', 'none', 'n/a', ''})
+
+# Entry number format: yyyyBBBnnnn (e.g. 2023CSB1122); [0-9] skips Unicode digit lookups
+_ENTRY_NUMBER_RE = re.compile(r'([0-9]{4})\s*([A-Za-z]{2,4})\s*([0-9]{2,5})')
+
+
+def _column_letter(index: int) -> str:
+    """0 -> 'A', 25 -> 'Z', 26 -> 'AA', ..."""
+    result = ""
+    while True:
+        result = chr(65 + (index % 26)) + result
+        index = index // 26 - 1
+        if index < 0:
+            break
+    return result
+
+
+# Minimum trigram Jaccard similarity for two names to count as the same person
+NAME_TRIGRAM_THRESHOLD = 0.4
+# Same, as a rapidfuzz token_set_ratio score (0-100) when rapidfuzz is installed
+NAME_FUZZ_THRESHOLD = 75
+# Whole-name similarity (rapidfuzz ratio) needed to write marks to a row by
+# name alone; only one-character OCR slips on a full name get through
+NAME_MATCH_FUZZ_CUTOFF = 92
+
+# Max edit distance for matching an OCR'd entry number that is on no sheet row
+# (e.g. '2O23CSB1122') to a row whose own entry number got no result
+ENTRY_FUZZ_MAX_DISTANCE = 1
+
+
+@functools.lru_cache(maxsize=4096)
+def _trigrams(text: str) -> frozenset:
+    """Character trigrams of a lowercased name (cached: sheet names repeat)."""
+    return frozenset(text[i:i + 3] for i in range(len(text) - 2))
+
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_entry_number(raw: str) -> Optional[str]:
+    """Normalize to YYYYBBBNNNN (cached: the same roster is re-read on every update)."""
+    clean = raw.strip() if raw else ''
+    if clean.lower() in _UNKNOWN_TOKENS:
+        return None
+
+    m = _ENTRY_NUMBER_RE.search(clean)
+    if m:
+        year = m.group(1)
+        branch = m.group(2).upper()
+        number = m.group(3)
+        return f"{year}{branch}{number}"
+
+    fallback = clean.translate(_STRIP_TABLE).upper()
+    if len(fallback) >= 6:
+        return fallback
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _name_key(name: str) -> Tuple[str, frozenset]:
+    """(lowercased name, its word set) — sheet names recur on every update run."""
+    lowered = name.strip().lower()
+    return lowered, frozenset(lowered.split())
+
+
+def _trim_trailing(cells: List) -> List:
+    """Drop trailing blank cells (Sheets omits them from responses)."""
+    end = len(cells)
+    while end and cells[end - 1] == '':
+        end -= 1
+    return cells[:end]
+
+
+# Every column Sheets allows (A..ZZZ = 26 + 26² + 26³), computed once
+_COL_LETTERS = tuple(_column_letter(i) for i in range(18278))
+_COL_INDEX = {letter: i for i, letter in enumerate(_COL_LETTERS)}
+
+# Sheets write quota is 60 requests/min per user; retry 429/5xx with backoff
+WRITE_REQUESTS_PER_MINUTE = 60
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 2.0
+RETRY_MAX_DELAY = 60.0
+
+
+class TokenBucket:
+    """
+    Token bucket shared by the sync and async write paths. reserve() takes a
+    token and returns how long the caller must wait before using it.
+    """
+
+    def __init__(self, capacity: int, per_seconds: float):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
 
 class SheetsService:
     SCOPES = [
@@ -45,10 +181,20 @@ class SheetsService:
         'observation', 'observations', 'issues', 'issue'
     }
 
+    # Header alias -> column role (alias sets are disjoint)
+    _ALIAS_TO_ROLE = {
+        alias: role
+        for role, aliases in (
+            ('entry_number', ENTRY_NUMBER_ALIASES),
+            ('name', NAME_ALIASES),
+            ('marks', MARKS_ALIASES),
+            ('comments', COMMENTS_ALIASES),
+        )
+        for alias in aliases
+    }
+
     # Regex for entry number format: yyyyBBBnnnn (e.g. 2023CSB1122)
-    ENTRY_NUMBER_PATTERN = re.compile(
-        r'(\d{4})\s*([A-Za-z]{2,4})\s*(\d{2,5})',
-    )
+    ENTRY_NUMBER_PATTERN = _ENTRY_NUMBER_RE
     
     # Regex for question columns: "1", "Q1", "Q 1", "Question 1", "1a" (if simple digit)
     # We will support simple integers for now as per current pipeline.
@@ -58,9 +204,27 @@ class SheetsService:
         re.IGNORECASE
     )
 
-    def __init__(self, credentials_path: str = "credentials.json"):
+    # ValueRanges per values().batchUpdate request
+    BATCH_UPDATE_CHUNK_SIZE = 500
+
+    # Spreadsheet metadata (tab titles/ids) rarely changes within a session
+    METADATA_TTL_SECONDS = 60
+
+    def __init__(self, credentials_path: str = "credentials.json", ttl_seconds: float = 60):
         self.creds = None
         self.service = None
+        self._meta_cache: Dict[str, Tuple[float, dict]] = {}
+        # httplib2 is not thread-safe: every self.service call goes through _execute
+        self._service_lock = threading.Lock()
+        # Separate lock so token refresh never waits behind a slow sheet read
+        self._token_lock = threading.Lock()
+        # (time, parsed student list, has comments) per (spreadsheet_id, gid); 0 disables
+        self.ttl_seconds = ttl_seconds
+        self._sheet_cache: Dict[Tuple[str, Optional[int]], Tuple[float, dict, bool]] = {}
+        # Header row + detected columns per (spreadsheet_id, tab title)
+        self._layout_cache: Dict[Tuple[str, str], Tuple[List, Dict]] = {}
+        # Proactive throttle so bulk writes stay under the per-minute quota
+        self._write_bucket = TokenBucket(WRITE_REQUESTS_PER_MINUTE, 60.0)
 
         # Try to load credentials
         if not os.path.exists(credentials_path):
@@ -85,6 +249,7 @@ class SheetsService:
     # ──────────────────────────────────────
 
     @staticmethod
+    @functools.lru_cache(maxsize=256)
     def parse_sheet_url(url: str) -> Tuple[str, Optional[str]]:
         """
         Extract spreadsheet ID and optional sheet name/GID from URL.
@@ -92,34 +257,40 @@ class SheetsService:
         spreadsheet_id = url
         sheet_name = None
 
-        match = re.search(r'/spreadsheets/d/([a-zA-Z0-9-_]+)', url)
+        match = _SHEET_ID_RE.search(url)
         if match:
             spreadsheet_id = match.group(1)
 
         return spreadsheet_id, sheet_name
 
+    @staticmethod
+    def _parse_gid(url: str) -> Optional[int]:
+        """Tab id from a '...#gid=123' URL, or None."""
+        match = _GID_RE.search(url)
+        return int(match.group(1)) if match else None
+
     # ──────────────────────────────────────
     #  Entry Number Normalization
     # ──────────────────────────────────────
 
-    @classmethod
-    def _normalize_entry_number(cls, raw: str) -> Optional[str]:
+    @staticmethod
+    def _normalize_entry_number(raw: str) -> Optional[str]:
         """Normalize to YYYYBBBNNNN."""
-        if not raw or raw.lower() in ('unknown', 'none', 'n/a', ''):
-            return None
+        return _normalize_entry_number(raw)
 
-        clean = raw.strip()
-        m = cls.ENTRY_NUMBER_PATTERN.search(clean)
-        if m:
-            year = m.group(1)
-            branch = m.group(2).upper()
-            number = m.group(3)
-            return f"{year}{branch}{number}"
-
-        fallback = re.sub(r'[\s\-_./]', '', clean).upper()
-        if len(fallback) >= 6:
-            return fallback
-        return None
+    @staticmethod
+    def _normalize_entry_numbers(raws: List[Any]) -> List[Optional[str]]:
+        """
+        _normalize_entry_number over a whole column. Goes through the cached
+        scalar, so a re-read roster (or re-submitted OCR keys) costs one dict
+        hit per value; blank cells (None/NaN) normalize to None.
+        """
+        keys = []
+        for raw in raws:
+            if not isinstance(raw, str):
+                raw = '' if raw is None or raw != raw else str(raw)  # NaN != NaN
+            keys.append(_normalize_entry_number(raw))
+        return keys
 
     # ──────────────────────────────────────
     #  Name Cross-Verification
@@ -128,27 +299,31 @@ class SheetsService:
     @staticmethod
     def _check_name_mismatch(sheet_name: str, ocr_name: str, entry_number: str, row: int) -> Optional[str]:
         """Returns mismatch message string if names don't match."""
-        if not sheet_name or not ocr_name:
+        if not sheet_name or not ocr_name or sheet_name == ocr_name:
             return None
 
-        s = sheet_name.strip().lower()
-        o = ocr_name.strip().lower()
+        s, s_parts = _name_key(sheet_name)
+        o, o_parts = _name_key(ocr_name)
 
         if not s or not o or s == 'unknown' or o == 'unknown':
             return None
 
         if s == o: return None
-        
-        s_parts = set(s.split())
-        o_parts = set(o.split())
-        if s_parts.intersection(o_parts): return None
+
+        if not s_parts.isdisjoint(o_parts): return None
 
         if s in o or o in s: return None
 
-        for word in s_parts:
-            if len(word) >= 3 and word in o: return None
-        for word in o_parts:
-            if len(word) >= 3 and word in s: return None
+        # Fuzzy fallback, tolerant of OCR typos ("Rohan" vs "Rohann")
+        if RAPIDFUZZ_AVAILABLE:
+            if fuzz.token_set_ratio(s, o) >= NAME_FUZZ_THRESHOLD:
+                return None
+            return f"Name mismatch: Sheet='{sheet_name}' vs OCR='{ocr_name}'"
+
+        s_tri = _trigrams(s)
+        o_tri = _trigrams(o)
+        if len(s_tri & o_tri) / max(1, len(s_tri | o_tri)) >= NAME_TRIGRAM_THRESHOLD:
+            return None
 
         return f"Name mismatch: Sheet='{sheet_name}' vs OCR='{ocr_name}'"
 
@@ -156,36 +331,61 @@ class SheetsService:
     #  Reading Student List
     # ──────────────────────────────────────
 
-    def read_student_list(self, sheet_url: str) -> Dict:
-        """Read the student list and detect columns."""
+    def read_student_list(self, sheet_url: str, include_existing_comment: bool = False) -> Dict:
+        """
+        Read the student list and detect columns (cached for ttl_seconds).
+        Each student's current comment cell is only read and returned as
+        'existing_comment' when include_existing_comment is set.
+        """
         if not self.service:
             raise RuntimeError("Sheets service not initialized. Check credentials.")
 
         spreadsheet_id, sheet_name = self.parse_sheet_url(sheet_url)
 
-        spreadsheet = self.service.spreadsheets().get(
-            spreadsheetId=spreadsheet_id
-        ).execute()
+        cache_key = (spreadsheet_id, self._parse_gid(sheet_url))
+        cached = self._sheet_cache.get(cache_key)
+        if (cached and time.monotonic() - cached[0] < self.ttl_seconds
+                and (cached[2] or not include_existing_comment)):
+            return cached[1]
+
+        spreadsheet = self._get_spreadsheet_metadata(spreadsheet_id)
 
         sheets = spreadsheet.get('sheets', [])
         if not sheets:
             raise ValueError("Spreadsheet has no sheets")
 
         if not sheet_name:
-            sheet_name = sheets[0]['properties']['title']
-
-        range_name = f"'{sheet_name}'"
-        result = self.service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=range_name
-        ).execute()
+            # Honor the tab the link points at; first tab otherwise
+            gid = self._parse_gid(sheet_url)
+            props = next(
+                (s['properties'] for s in sheets if s['properties'].get('sheetId') == gid),
+                sheets[0]['properties'],
+            )
+            sheet_name = props['title']
+
+        # Known layout: fetch only the header row and the columns we parse
+        layout_key = (spreadsheet_id, sheet_name)
+        layout = self._layout_cache.get(layout_key)
+        column_values = (
+            self._fetch_student_columns(spreadsheet_id, sheet_name, *layout, include_existing_comment)
+            if layout else None
+        )
+
+        if column_values is not None:
+            headers, columns = layout
+        else:
+            range_name = f"'{sheet_name}'"
+            result = self._execute(self.service.spreadsheets().values().get(
+                spreadsheetId=spreadsheet_id,
+                range=range_name
+            ))
 
-        values = result.get('values', [])
-        if not values or len(values) < 2:
-            raise ValueError("Sheet is empty or has no data rows")
+            values = result.get('values', [])
+            if not values or len(values) < 2:
+                raise ValueError("Sheet is empty or has no data rows")
 
-        headers = values[0]
-        columns = self._detect_columns(headers)
+            headers = values[0]
+            columns = self._detect_columns(headers)
 
         if not columns.get('entry_number'):
             raise ValueError(
@@ -193,50 +393,265 @@ class SheetsService:
                 f"Expected one of: {self.ENTRY_NUMBER_ALIASES}"
             )
 
-        students = []
         entry_col = columns['entry_number']['index']
         name_col = columns.get('name', {}).get('index')
         comments_col = columns.get('comments', {}).get('index')
 
-        for row_idx, row in enumerate(values[1:], start=2):
-            entry_number = self._safe_get(row, entry_col, '').strip()
-            if not entry_number:
-                continue
-
-            name = self._safe_get(row, name_col, '').strip() if name_col is not None else ''
-            existing_comment = self._safe_get(row, comments_col, '') if comments_col is not None else ''
+        if column_values is None:
+            self._layout_cache[layout_key] = (headers, columns)
+            # Ragged rows are padded with None
+            df = pd.DataFrame(values[1:], dtype="object")
+            column_values = [
+                df[idx] if idx is not None and idx in df.columns else ()
+                for idx in (entry_col, name_col, comments_col)
+            ]
+            if not include_existing_comment:
+                column_values[2] = None
 
-            students.append({
-                "row": row_idx,
-                "entry_number": entry_number,
-                "name": name,
-                "existing_comment": existing_comment
-            })
+        students = self._student_records(*column_values)
 
-        return {
+        sheet_data = {
             "spreadsheet_id": spreadsheet_id,
             "sheet_name": sheet_name,
             "columns": columns,
             "students": students,
         }
+        self._sheet_cache[cache_key] = (time.monotonic(), sheet_data, include_existing_comment)
+        return sheet_data
+
+    def _fetch_student_columns(self, spreadsheet_id: str, sheet_name: str, headers: List, columns: Dict,
+                               include_comments: bool) -> Optional[List]:
+        """
+        One column-major batchGet of the header row plus the entry/name (and
+        optionally comment) columns, rows 2+. Returns the three value lists
+        (comments None when not requested), or None when the header row no
+        longer matches the cached layout (caller re-reads fully).
+        """
+        prefix = f"'{sheet_name}'!"
+        letters = [columns.get(role, {}).get('letter') for role in ('entry_number', 'name', 'comments')]
+        if not include_comments:
+            letters[2] = None
+        ranges = [f"{prefix}1:1"] + [f"{prefix}{letter}2:{letter}" for letter in letters if letter]
+
+        result = self._execute(self.service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id,
+            ranges=ranges,
+            majorDimension='COLUMNS',
+        ))
+        value_ranges = result.get('valueRanges', [])
+        if len(value_ranges) != len(ranges):
+            return None
+
+        # Header row arrives as one single-cell column per header
+        current = [col[0] if col else '' for col in value_ranges[0].get('values', [])]
+        if _trim_trailing(current) != _trim_trailing(list(headers)):
+            return None
+
+        fetched = iter(value_ranges[1:])
+        column_values = [
+            (next(fetched).get('values') or [[]])[0] if letter else ()
+            for letter in letters
+        ]
+        if not any(len(vals) for vals in column_values):
+            return None  # let the full read report an empty sheet
+        if not include_comments:
+            column_values[2] = None
+        return column_values
+
+    @classmethod
+    def _student_records(cls, entry_values, name_values, comment_values) -> List[Dict]:
+        """
+        Student dicts from column-wise values for sheet rows 2, 3, ...
+        'normalized_entry' is the matching key (None if unusable);
+        comment_values=None leaves out the 'existing_comment' key.
+        """
+        entries = pd.Series(entry_values, dtype="object")
+        index = pd.RangeIndex(len(entries))
+
+        def column(values) -> pd.Series:
+            return pd.Series(values, dtype="object").reindex(index).fillna('').astype(str)
+
+        rows = pd.DataFrame({
+            "row": index + 2,
+            "entry_number": column(entries).str.strip(),
+            "name": column(name_values).str.strip(),
+        })
+        if comment_values is not None:
+            rows["existing_comment"] = column(comment_values)
+        rows = rows[rows["entry_number"] != '']
+        normalized = cls._normalize_entry_numbers(rows["entry_number"].tolist())
+        rows = rows.assign(normalized_entry=pd.Series(normalized, index=rows.index, dtype="object"))
+        return rows.to_dict(orient="records")
+
+    def invalidate_cache(self, sheet_url: Optional[str] = None):
+        """Drop the cached student list for one sheet URL, or for all sheets."""
+        if sheet_url is None:
+            self._sheet_cache.clear()
+            self._meta_cache.clear()
+            self._layout_cache.clear()
+            return
+        spreadsheet_id, _ = self.parse_sheet_url(sheet_url)
+        self._sheet_cache.pop((spreadsheet_id, self._parse_gid(sheet_url)), None)
+
+    def _get_spreadsheet_metadata(self, spreadsheet_id: str) -> dict:
+        """
+        spreadsheets().get() limited to tab titles/ids (no grid data), cached
+        per spreadsheet for METADATA_TTL_SECONDS.
+        """
+        now = time.monotonic()
+        cached = self._meta_cache.get(spreadsheet_id)
+        if cached and now - cached[0] < self.METADATA_TTL_SECONDS:
+            return cached[1]
+
+        spreadsheet = self._execute(self.service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            fields='sheets.properties(title,sheetId)',
+        ))
+        self._meta_cache[spreadsheet_id] = (now, spreadsheet)
+        return spreadsheet
 
     # ──────────────────────────────────────
     #  Writing Marks
     # ──────────────────────────────────────
 
-    def update_marks(self, sheet_url: str, results: List[Dict]) -> Dict:
+    def update_marks(self, sheet_url: str, results: List[Dict], sheet_data: Optional[Dict] = None) -> Dict:
         """
         Write marks, comments, AND per-question scores.
+        Pass sheet_data (from read_student_list) to skip re-reading the sheet.
+        """
+        spreadsheet_id, batch_data, summary, matched = self._plan_mark_writes(sheet_url, results, sheet_data)
+        if batch_data:
+            try:
+                for i in range(0, len(batch_data), self.BATCH_UPDATE_CHUNK_SIZE):
+                    body = {
+                        "valueInputOption": "RAW",
+                        "data": batch_data[i:i + self.BATCH_UPDATE_CHUNK_SIZE],
+                    }
+                    self._execute_write(self.service.spreadsheets().values().batchUpdate(
+                        spreadsheetId=spreadsheet_id,
+                        body=body
+                    ))
+                self._report_update(summary, batch_data, matched)
+            except Exception as e:
+                summary['errors'].append(f"Batch update failed: {str(e)}")
+                print(f"❌ Batch update failed: {e}")
+            # Marks/comments just changed (possibly partially); re-read next time
+            self.invalidate_cache(sheet_url)
+
+        return summary
+
+    async def update_marks_async(self, sheet_url: str, results: List[Dict], sheet_data: Optional[Dict] = None,
+                                 client: Optional["httpx.AsyncClient"] = None) -> Dict:
+        """
+        Async counterpart of update_marks (same summary). The sheet read runs in
+        a worker thread and the batchUpdate goes out over httpx, so several
+        sheets can be written concurrently with asyncio.gather(). Pass a shared
+        client to reuse its connection pool across sheets.
+        """
+        spreadsheet_id, batch_data, summary, matched = await asyncio.to_thread(
+            self._plan_mark_writes, sheet_url, results, sheet_data
+        )
+        if batch_data:
+            own_client = client is None
+            if own_client:
+                client = httpx.AsyncClient(timeout=30)
+            try:
+                headers = await asyncio.to_thread(self._auth_header)
+                url = f"{SHEETS_API_URL}/{spreadsheet_id}/values:batchUpdate"
+                for i in range(0, len(batch_data), self.BATCH_UPDATE_CHUNK_SIZE):
+                    body = {
+                        "valueInputOption": "RAW",
+                        "data": batch_data[i:i + self.BATCH_UPDATE_CHUNK_SIZE],
+                    }
+                    await self._post_write_async(client, url, headers, body)
+                self._report_update(summary, batch_data, matched)
+            except Exception as e:
+                summary['errors'].append(f"Batch update failed: {str(e)}")
+                print(f"❌ Batch update failed: {e}")
+            finally:
+                if own_client:
+                    await client.aclose()
+            self.invalidate_cache(sheet_url)
+
+        return summary
+
+    @staticmethod
+    def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+        """Exponential backoff, honoring a numeric Retry-After header if present."""
+        if retry_after:
+            try:
+                return min(RETRY_MAX_DELAY, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+        return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+
+    def _execute_write(self, request):
+        """
+        Execute a write request under the token bucket, retrying 429/5xx.
+        Other HTTP errors are raised immediately.
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            time.sleep(self._write_bucket.reserve())
+            try:
+                return self._execute(request)
+            except HttpError as e:
+                status = getattr(e.resp, 'status', None)
+                if status not in RETRY_STATUS_CODES or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                delay = self._retry_delay(attempt, e.resp.get('retry-after'))
+                print(f"⚠️ Sheets returned {status}, retrying in {delay:.1f}s...")
+                time.sleep(delay)
+
+    async def _post_write_async(self, client: "httpx.AsyncClient", url: str, headers: Dict, body: Dict):
+        """Async counterpart of _execute_write over httpx."""
+        for attempt in range(MAX_ATTEMPTS):
+            await asyncio.sleep(self._write_bucket.reserve())
+            response = await client.post(url, headers=headers, json=body)
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_ATTEMPTS - 1:
+                response.raise_for_status()
+                return response
+            delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+            print(f"⚠️ Sheets returned {response.status_code}, retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+    def _execute(self, request):
+        """Run a googleapiclient request; the shared httplib2 client is serialized."""
+        with self._service_lock:
+            return request.execute()
+
+    def _auth_header(self) -> Dict[str, str]:
+        """Bearer header from the service account, refreshed when expired."""
+        with self._token_lock:
+            if not self.creds.valid:
+                self.creds.refresh(google.auth.transport.requests.Request())
+            return {"Authorization": f"Bearer {self.creds.token}"}
+
+    @staticmethod
+    def _report_update(summary: Dict, batch_data: List[Dict], matched: int):
+        cell_count = sum(len(row) - row.count(None) for vr in batch_data for row in vr["values"])
+        summary['updated'] = matched
+        print(f"✅ Updated {cell_count} cells ({len(batch_data)} ranges) for {matched} students.")
+
+    def _plan_mark_writes(self, sheet_url: str, results: List[Dict],
+                          sheet_data: Optional[Dict] = None) -> Tuple[str, List[Dict], Dict, int]:
+        """
+        Read the sheet and match results to rows. Returns (spreadsheet_id,
+        ValueRanges to write, summary, matched student count); nothing is
+        written here.
         """
         if not self.service:
             raise RuntimeError("Sheets service not initialized. Check credentials.")
 
         # Read current state
-        sheet_data = self.read_student_list(sheet_url)
+        if sheet_data is None:
+            sheet_data = self.read_student_list(sheet_url)
         spreadsheet_id = sheet_data['spreadsheet_id']
         sheet_name = sheet_data['sheet_name']
         columns = sheet_data['columns']
         students = sheet_data['students']
+        if students and 'normalized_entry' not in students[0]:
+            keys = self._normalize_entry_numbers([s['entry_number'] for s in students])
+            students = [dict(s, normalized_entry=key) for s, key in zip(students, keys)]
 
         # Check required columns
         if not columns.get('marks'):
@@ -246,13 +661,10 @@ class SheetsService:
         comments_col_letter = columns.get('comments', {}).get('letter')
         question_cols = columns.get('questions', {}) # Dict[int, Dict] {1: {index, letter}, ...}
 
-        # Build lookup
-        results_map = {}
-        for r in results:
-            raw = str(r.get('entry_number', '')).strip()
-            normalized = self._normalize_entry_number(raw)
-            if normalized:
-                results_map[normalized] = r
+        # Build lookup (entry numbers normalized through the per-value cache)
+        result_keys = self._normalize_entry_numbers([r.get('entry_number') for r in results])
+        key_index = {normalized: i for i, normalized in enumerate(result_keys) if normalized}
+        results_map = {normalized: results[i] for normalized, i in key_index.items()}
 
         summary = {
             "updated": 0,
@@ -262,15 +674,27 @@ class SheetsService:
             "errors": [],
         }
 
-        batch_data = []
+        name_index = None
+
+        # Pending writes: column letter -> {row: value}
+        cell_writes: Dict[str, Dict[int, Any]] = {}
         matched_normalized = set()
+        used_results = set()  # id() of results written to some row
+        question_scores: Dict[int, Dict[int, Any]] = {}  # id(result) -> {q_num: value}
+
+        logger.debug("Results map keys: %s", results_map.keys())
 
-        # DEBUG
-        print(f"DEBUG: Results Map Keys: {list(results_map.keys())}")
+        # One-typo OCR keys, paired only when the row and the key pick each other
+        row_counts = Counter(s['normalized_entry'] for s in students if s['normalized_entry'])
+        near_keys = self._near_entry_keys(row_counts, results_map)
+
+        # Results some row claims by entry number never go to another row by name
+        claimed_keys = set(near_keys.values()).union(k for k in row_counts if k in results_map)
+        taken = {i for i, k in enumerate(result_keys) if k in claimed_keys}
 
         for student in students:
             raw_entry = student['entry_number']
-            normalized = self._normalize_entry_number(raw_entry)
+            normalized = student['normalized_entry']
             
             # DEBUG
             # print(f"DEBUG: Sheet Row {student['row']}: '{raw_entry}' -> Normalized: '{normalized}'")
@@ -278,51 +702,27 @@ class SheetsService:
             if not normalized:
                 continue
 
-            # 1. Try Entry Number Match
-            if normalized in results_map:
-                matched_normalized.add(normalized)
-                result = results_map[normalized]
+            # 1. Try Entry Number Match (exact, else a mutually unique one-typo OCR key)
+            key = normalized if normalized in results_map else near_keys.get(normalized)
+            if key:
+                matched_normalized.add(key)
+                result_idx = key_index[key]
             else:
-                # 2. Fallback: Try Name Match
-                # Iterate through all results to find a name match
-                found_by_name = None
-                sheet_name_cleaned = student.get('name', '').strip().lower()
-                
-                if sheet_name_cleaned:
-                    for r in results:
-                        ocr_name_cleaned = r.get('name', '').strip().lower()
-                        # Simple inclusion check or intersection
-                        if not ocr_name_cleaned: continue
-                        
-                        # Use existing name check logic? Or simplified?
-                        # If exact match or significant overlap
-                        if sheet_name_cleaned == ocr_name_cleaned:
-                            found_by_name = r
-                            break
-                        
-                        # Split parts
-                        s_parts = set(sheet_name_cleaned.split())
-                        o_parts = set(ocr_name_cleaned.split())
-                        intersection = s_parts.intersection(o_parts)
-                        
-                        # If at least 2 significant words match (e.g. "Harsh Modi")
-                        if len(intersection) >= 2:
-                            found_by_name = r
-                            break
-                        # Or if 1 word matches and total words is small, but be careful of "Kumar"
-                        if len(intersection) >= 1 and len(s_parts) == 1 and len(o_parts) == 1:
-                             found_by_name = r
-                             break
-
-                if found_by_name:
-                    result = found_by_name
-                    # mismatch_msg = f"Matched by Name ('{student['name']}') instead of ID ('{raw_entry}' vs OCR '{result.get('entry_number')}')"
-                    # final_comments.append(mismatch_msg)
-                else:
+                # 2. Fallback: Try Name Match over results no other row has taken
+                # (index over result names, built on first use)
+                if name_index is None:
+                    name_index = self._build_name_index(results)
+                result_idx = self._match_by_name(student.get('name', ''), name_index, taken)
+
+                if result_idx is None:
                     summary['not_found_in_results'].append(raw_entry)
                     continue
+                # mismatch_msg = f"Matched by Name ('{student['name']}') instead of ID ('{raw_entry}' vs OCR '{result.get('entry_number')}')"
+                # final_comments.append(mismatch_msg)
 
-            # Check duplication (if multiple students map to same result? Not detecting here)
+            result = results[result_idx]
+            taken.add(result_idx)
+            used_results.add(id(result))
             
             score = result.get('total_score', 0)
             details = result.get('details', []) # List of dicts/objects
@@ -351,109 +751,153 @@ class SheetsService:
             comment_str = "; ".join(final_comments)
 
             # 1. Update Total Score
-            batch_data.append({
-                "range": f"'{sheet_name}'!{marks_col_letter}{student['row']}",
-                "values": [[score]]
-            })
+            cell_writes.setdefault(marks_col_letter, {})[student['row']] = score
             
             # 2. Update Comment
             if comments_col_letter and comment_str:
-                batch_data.append({
-                    "range": f"'{sheet_name}'!{comments_col_letter}{student['row']}",
-                    "values": [[comment_str]]
-                })
+                cell_writes.setdefault(comments_col_letter, {})[student['row']] = comment_str
 
-            # 3. Update Per-Question Scores
-            q_map = {}
-            if isinstance(details, list):
-                for d in details:
-                    try:
-                        if isinstance(d, dict):
-                            qn = int(d.get('question_number', -1))
-                            q_map[qn] = d
-                        else:
-                            qn = int(d.question_number)
-                            q_map[qn] = d
-                    except (ValueError, TypeError, AttributeError):
-                        continue
-            
-            # DEBUG: Print details for the first matched student
+            # 3. Update Per-Question Scores (computed once per result)
+            q_scores = question_scores.get(id(result))
+            if q_scores is None:
+                q_scores = question_scores[id(result)] = self._question_scores(details)
+
+            # Details for the first matched student (formatted only at DEBUG)
             if len(matched_normalized) == 1:
-                print(f"🔍 DEBUG: Inspecting first student {raw_entry}")
-                print(f"   Details count: {len(details)}")
-                print(f"   Q_MAP keys (int): {list(q_map.keys())}")
-                print(f"   Question Cols keys (int): {list(question_cols.keys())}")
-                
+                logger.debug(
+                    "Inspecting first student %s: %d details, scored questions %s, question cols %s",
+                    raw_entry, len(details), q_scores.keys(), question_cols.keys(),
+                )
+
             for q_num, col_info in question_cols.items():
-                col_letter = col_info['letter']
-                
-                if q_num in q_map:
-                    q_data = q_map[q_num]
-                    val_to_write = 0
-                    
-                    if isinstance(q_data, dict):
-                        status = q_data.get('result', '')
-                        val = q_data.get('score', 0)
-                    else:
-                        status = getattr(q_data, 'result', '')
-                        val = getattr(q_data, 'score', 0)
-                    
-                    if status in ['multiple', 'unattempted', 'incorrect']:
-                        val_to_write = 0
-                    elif status == 'correct':
-                        val_to_write = val # Should be full marks
-                    else:
-                         # Default fallback
-                        val_to_write = val
-                    
-                    # Add to batch
-                    batch_data.append({
-                        "range": f"'{sheet_name}'!{col_letter}{student['row']}",
-                        "values": [[val_to_write]]
-                    })
-                else:
-                    # If the student didn't have data for this question (e.g. absent/error or not in answer key?)
-                    # We can choose to write 0 or leave blank.
-                    pass
+                # Questions the student has no data for are left blank
+                if q_num in q_scores:
+                    cell_writes.setdefault(col_info['letter'], {})[student['row']] = q_scores[q_num]
 
-        # Execute batch update
-        if batch_data:
-            try:
-                # Split huge batches if necessary (Google limit is around 50k calls?? No, payload size)
-                # Chunking 1000 updates at a time is safer
-                chunk_size = 500
-                for i in range(0, len(batch_data), chunk_size):
-                    chunk = batch_data[i:i + chunk_size]
-                    body = {
-                        "valueInputOption": "RAW",
-                        "data": chunk,
-                    }
-                    self.service.spreadsheets().values().batchUpdate(
-                        spreadsheetId=spreadsheet_id,
-                        body=body
-                    ).execute()
-                
-                summary['updated'] = len(matched_normalized)
-                print(f"✅ Updated {len(batch_data)} cells for {len(matched_normalized)} students.")
-            except Exception as e:
-                summary['errors'].append(f"Batch update failed: {str(e)}")
-                print(f"❌ Batch update failed: {e}")
+        summary['not_found_in_sheet'] = [
+            r.get('entry_number') for r in results if id(r) not in used_results
+        ]
 
-        return summary
+        batch_data = self._coalesce_writes(sheet_name, cell_writes)
+        return spreadsheet_id, batch_data, summary, len(matched_normalized)
 
     # ──────────────────────────────────────
     #  Helpers
     # ──────────────────────────────────────
 
-    QUESTION_COLUMN_PATTERN = re.compile(
-        r'^(?:q|ques|question)?[\s\.\-\_]*(\d+)$', 
-        re.IGNORECASE
-    )
+    @staticmethod
+    def _near_entry_keys(row_counts: Counter, results_map: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Sheet key -> result key for OCR keys that match no row exactly but are
+        within ENTRY_FUZZ_MAX_DISTANCE edits of exactly one unmatched row,
+        which in turn is near no other such key. Rows whose entry number
+        appears more than once are never paired. Empty without rapidfuzz.
+        """
+        if not RAPIDFUZZ_AVAILABLE:
+            return {}
+        open_rows = [k for k in row_counts if k not in results_map]
+        open_results = [k for k in results_map if k not in row_counts]
+        if not open_rows or not open_results:
+            return {}
+
+        pairs: Dict[str, List[str]] = {}
+        for result_key in open_results:
+            near = process.extract(
+                result_key, open_rows, scorer=Levenshtein.distance,
+                score_cutoff=ENTRY_FUZZ_MAX_DISTANCE, limit=2
+            )
+            if len(near) == 1:
+                pairs.setdefault(near[0][0], []).append(result_key)
+        return {
+            row_key: keys[0] for row_key, keys in pairs.items()
+            if len(keys) == 1 and row_counts[row_key] == 1
+        }
+
+    @staticmethod
+    def _question_scores(details: Any) -> Dict[int, Any]:
+        """
+        {question number: value to write} from a result's details (dicts or
+        objects). Multiple, unattempted and incorrect answers score 0.
+        """
+        scores = {}
+        if not isinstance(details, list):
+            return scores
+        for d in details:
+            try:
+                if isinstance(d, dict):
+                    qn = int(d.get('question_number', -1))
+                    status = d.get('result', '')
+                    val = d.get('score', 0)
+                else:
+                    qn = int(d.question_number)
+                    status = getattr(d, 'result', '')
+                    val = getattr(d, 'score', 0)
+            except (ValueError, TypeError, AttributeError):
+                continue
+            scores[qn] = 0 if status in ('multiple', 'unattempted', 'incorrect') else val
+        return scores
+
+    @staticmethod
+    def _build_name_index(results: List[Dict]) -> Tuple[List[str], List[frozenset], Dict[str, List[int]]]:
+        """Each result's cleaned name and word set, plus word -> result indexes (ascending)."""
+        result_names = []
+        result_parts = []
+        by_word: Dict[str, List[int]] = {}
+        for i, r in enumerate(results):
+            cleaned, parts = _name_key(r.get('name') or '')
+            result_names.append(cleaned)
+            result_parts.append(parts)
+            for word in parts:
+                by_word.setdefault(word, []).append(i)
+        return result_names, result_parts, by_word
+
+    @staticmethod
+    def _match_by_name(sheet_name: str,
+                       name_index: Tuple[List[str], List[frozenset], Dict[str, List[int]]],
+                       excluded: set) -> Optional[int]:
+        """
+        Index of the first result (in results order, skipping excluded) whose
+        name matches the sheet name: identical, sharing 2+ words, or both
+        single words that agree. Only results sharing a word with the sheet
+        name are examined. With rapidfuzz installed, a near-identical OCR
+        spelling is accepted last.
+        """
+        sheet_cleaned, s_parts = _name_key(sheet_name or '')
+        if not sheet_cleaned:
+            return None
+        result_names, result_parts, by_word = name_index
+
+        candidates = sorted({i for word in s_parts for i in by_word.get(word, ())}.difference(excluded))
+        for i in candidates:
+            o_parts = result_parts[i]
+            # If at least 2 significant words match (e.g. "Harsh Modi"), or the
+            # names are identical, or 1 word matches and both are single words
+            # (careful of "Kumar")
+            overlap = len(s_parts & o_parts)
+            if (overlap >= 2 or (len(s_parts) == 1 and len(o_parts) == 1)
+                    or result_names[i] == sheet_cleaned):
+                return i
+
+        if RAPIDFUZZ_AVAILABLE:
+            open_names = {i: name for i, name in enumerate(result_names) if i not in excluded}
+            best = process.extractOne(
+                sheet_cleaned, open_names, scorer=fuzz.ratio, score_cutoff=NAME_MATCH_FUZZ_CUTOFF
+            )
+            if best:
+                return best[2]
+        return None
 
     def _detect_columns(self, headers: List[str]) -> Dict:
         """
         Auto-detect columns including Question columns (1, Q1, etc.)
+        Cached per raw header row (sheets made from one template share it),
+        so treat the returned dict as read-only.
         """
+        return self._detect_columns_cached(tuple(headers))
+
+    @classmethod
+    @functools.lru_cache(maxsize=64)
+    def _detect_columns_cached(cls, headers: Tuple[str, ...]) -> Dict:
         columns = {'questions': {}}
         
         # Helper to normalize
@@ -461,35 +905,17 @@ class SheetsService:
 
         for idx, header_raw in enumerate(headers):
             h = norm(header_raw)
-            col_letter = self._index_to_letter(idx)
+            col_letter = cls._index_to_letter(idx)
             
-            # 1. Entry Number (High Priority)
-            if not columns.get('entry_number'):
-                if h in self.ENTRY_NUMBER_ALIASES:
-                    columns['entry_number'] = {"index": idx, "letter": col_letter, "header": header_raw}
-                    continue
-
-            # 2. Student Name
-            if not columns.get('name'):
-                 if h in self.NAME_ALIASES:
-                    columns['name'] = {"index": idx, "letter": col_letter, "header": header_raw}
-                    continue
-
-            # 3. Marks / Total Score
-            if not columns.get('marks'):
-                 if h in self.MARKS_ALIASES:
-                    columns['marks'] = {"index": idx, "letter": col_letter, "header": header_raw}
-                    continue
-            
-            # 4. Comments
-            if not columns.get('comments'):
-                 if h in self.COMMENTS_ALIASES:
-                    columns['comments'] = {"index": idx, "letter": col_letter, "header": header_raw}
-                    continue
+            # 1-4. Entry number / name / marks / comments: one dict lookup
+            role = cls._ALIAS_TO_ROLE.get(h)
+            if role and role not in columns:
+                columns[role] = {"index": idx, "letter": col_letter, "header": header_raw}
+                continue
 
             # 5. Question Columns (Check regex)
             # Try matching "Q1", "Question 1", "1", etc.
-            m = self.QUESTION_COLUMN_PATTERN.match(h)
+            m = cls.QUESTION_COLUMN_PATTERN.match(h)
             if m:
                 try:
                     q_num = int(m.group(1))
@@ -498,12 +924,7 @@ class SheetsService:
                     continue
                 except ValueError:
                     pass
-            
-            # 6. Fallback: If header is just an integer, treat as question
-            if header_raw.strip().isdigit():
-                 q_num = int(header_raw.strip())
-                 if q_num not in columns['questions']:
-                     columns['questions'][q_num] = {"index": idx, "letter": col_letter, "header": header_raw}
+            # (bare integers like "3" are matched by the pattern above)
 
         if columns.get('questions'):
             print(f"📊 Detected {len(columns['questions'])} question columns: {sorted(list(columns['questions'].keys()))}")
@@ -511,17 +932,60 @@ class SheetsService:
         return columns
 
     @staticmethod
-    def _index_to_letter(index: int) -> str:
-        result = ""
-        while True:
-            result = chr(65 + (index % 26)) + result
-            index = index // 26 - 1
-            if index < 0:
-                break
-        return result
+    def _coalesce_writes(sheet_name: str, cell_writes: Dict[str, Dict[int, Any]]) -> List[Dict]:
+        """
+        Turn per-cell writes into ValueRanges. A column whose written rows are
+        dense (span < 2x the number of writes) becomes one A1 range, and runs
+        of adjacent dense columns (marks, comments, Q1, Q2, ...) are merged
+        into one rectangle. Gaps are sent as null, which the Sheets API skips,
+        so unmatched rows keep their existing contents. Sparse columns stay
+        one range per cell.
+        """
+        value_ranges = []
+        sheet_prefix = f"'{sheet_name}'!"
+        dense = []  # (column index, letter, writes) for columns worth a block
+        for col_letter, by_row in cell_writes.items():
+            rows = sorted(by_row)
+            if rows[-1] - rows[0] < len(rows) * 2:
+                dense.append((_COL_INDEX[col_letter], col_letter, by_row))
+            else:
+                col_prefix = sheet_prefix + col_letter
+                value_ranges.extend(
+                    {"range": col_prefix + str(row), "values": [[by_row[row]]]}
+                    for row in rows
+                )
+
+        # Group dense columns into runs of consecutive indexes
+        dense.sort(key=lambda c: c[0])
+        runs = []
+        for col in dense:
+            if runs and runs[-1][-1][0] == col[0] - 1:
+                runs[-1].append(col)
+            else:
+                runs.append([col])
+
+        for run in runs:
+            blocks = [run]
+            min_row = min(min(by_row) for _, _, by_row in run)
+            max_row = max(max(by_row) for _, _, by_row in run)
+            writes = sum(len(by_row) for _, _, by_row in run)
+            if len(run) > 1 and (max_row - min_row + 1) * len(run) >= writes * 2:
+                blocks = [[col] for col in run]  # rows barely overlap; keep columns apart
+            for block in blocks:
+                lo = min(min(by_row) for _, _, by_row in block)
+                hi = max(max(by_row) for _, _, by_row in block)
+                value_ranges.append({
+                    "range": f"{sheet_prefix}{block[0][1]}{lo}:{block[-1][1]}{hi}",
+                    "values": [
+                        [by_row.get(row) for _, _, by_row in block]
+                        for row in range(lo, hi + 1)
+                    ]
+                })
+        return value_ranges
 
     @staticmethod
-    def _safe_get(lst: list, idx: Optional[int], default=None):
-        if idx is None or idx >= len(lst):
-            return default
-        return lst[idx]
+    def _index_to_letter(index: int) -> str:
+        if index < len(_COL_LETTERS):
+            return _COL_LETTERS[index]
+        return _column_letter(index)
+
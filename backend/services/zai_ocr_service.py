@@ -2,6 +2,16 @@ import os
 from zai import ZaiClient
 import json
 import base64
+import mmap
+import orjson
+
+
+def _encode_file(path: str) -> str:
+    """Base64 of the file, straight from a read-only mapping (no intermediate bytes copy)."""
+    with open(path, "rb") as image_file:
+        with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return base64.b64encode(mm).decode('ascii')
+
 
 class ZaiOCRService:
     def __init__(self):
@@ -37,17 +47,32 @@ class ZaiOCRService:
             print(f"Sending {image_path} to Zai GLM-OCR...")
             
             # SDK requires Base64 for local files
-            with open(image_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
+            if os.path.getsize(image_path) == 0:
+                print(f"Zai OCR: Empty file {image_path}")
+                return ""
+            encoded_string = _encode_file(image_path)
             
             response = self.client.layout_parsing.create(
                 model="glm-ocr",
                 file=encoded_string 
             )
             
-            # Return raw string representation for LLM structuring
-            return str(response)
+            return self._response_text(response)
             
         except Exception as e:
             print(f"Zai OCR extraction failed: {e}")
             return ""
+
+    @staticmethod
+    def _response_text(response) -> str:
+        """
+        The parsed page text for LLM structuring: the markdown result when the
+        SDK provides one, else the response as compact JSON (stable across SDK
+        versions, unlike its repr()).
+        """
+        md = getattr(response, "md_results", None)
+        if isinstance(md, str) and md:
+            return md
+        if hasattr(response, "model_dump"):
+            return orjson.dumps(response.model_dump(exclude_none=True), default=str).decode()
+        return str(response)
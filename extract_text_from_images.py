@@ -1,12 +1,25 @@
 import requests
 import base64
+import functools
 import json
+import mmap
+import orjson
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 def encode_image(image_path):
-    """Encode image to base64"""
+    """Encode image to base64 (cached until the file changes)"""
+    st = os.stat(image_path)
+    if st.st_size == 0:
+        return ""
+    return _encode_cached(image_path, st.st_mtime, st.st_size)
+
+@functools.lru_cache(maxsize=8)
+def _encode_cached(image_path, mtime, size):
+    """Base64 from a read-only mapping (no intermediate copy); keyed on mtime/size"""
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+        with mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return base64.b64encode(mm).decode('ascii')
 
 def extract_text_via_vertex_ai(image_path, api_key):
     """Extract text from image using Vertex AI Gemini API"""
@@ -60,27 +73,18 @@ def extract_text_via_vertex_ai(image_path, api_key):
         response = requests.post(url, headers=headers, json=payload, timeout=30)
         response.raise_for_status()
         
-        # Parse streaming response
-        result = response.json()
-        
+        # Parse streaming response (a list of chunks, or a single object)
+        result = orjson.loads(response.content)
+        chunks = result if isinstance(result, list) else [result] if isinstance(result, dict) else ()
+
         # Collect all text parts
-        all_text = []
-        
-        if isinstance(result, list):
-            for chunk in result:
-                if "candidates" in chunk:
-                    for candidate in chunk["candidates"]:
-                        if "content" in candidate and "parts" in candidate["content"]:
-                            for part in candidate["content"]["parts"]:
-                                if "text" in part:
-                                    all_text.append(part["text"])
-        elif isinstance(result, dict):
-            if "candidates" in result:
-                for candidate in result["candidates"]:
-                    if "content" in candidate and "parts" in candidate["content"]:
-                        for part in candidate["content"]["parts"]:
-                            if "text" in part:
-                                all_text.append(part["text"])
+        all_text = [
+            part["text"]
+            for chunk in chunks
+            for candidate in chunk.get("candidates", ())
+            for part in candidate.get("content", {}).get("parts", ())
+            if "text" in part
+        ]
         
         # Combine all text
         combined_text = "".join(all_text)
@@ -99,6 +103,9 @@ def extract_text_via_vertex_ai(image_path, api_key):
             print(f"Response status: {e.response.status_code}")
             print(f"Response body: {e.response.text}")
         return None
+    except orjson.JSONDecodeError as e:
+        print(f"❌ Could not parse response: {e}")
+        return None
 
 def main():
     # API Key
@@ -110,14 +117,20 @@ def main():
         "/Users/harsh/Desktop/DEP/WhatsApp Image 2026-02-09 at 12.05.08 PM.jpeg"
     ]
     
-    # Extract text from both images
-    results = {}
+    # Extract text from all images concurrently (each call is network-bound)
+    existing = []
     for image_path in images:
         if os.path.exists(image_path):
-            text = extract_text_via_vertex_ai(image_path, API_KEY)
-            results[os.path.basename(image_path)] = text
+            existing.append(image_path)
         else:
             print(f"❌ Image not found: {image_path}")
+
+    results = {}
+    if existing:
+        with ThreadPoolExecutor(max_workers=min(8, len(existing))) as pool:
+            texts = pool.map(lambda path: extract_text_via_vertex_ai(path, API_KEY), existing)
+            for image_path, text in zip(existing, texts):
+                results[os.path.basename(image_path)] = text
     
     # Save combined results
     output_file = "/Users/harsh/Desktop/DEP/extracted_text_output.txt"